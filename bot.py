@@ -6,17 +6,32 @@
 
 import asyncio
 import logging
+import hmac
+import math
+import queue
+import random
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, reduce
+from html import unescape
 import aiohttp
-from telegram import Bot, Update
+from aiohttp import web
+from telegram import Bot, MessageEntity, Update
 from telegram.ext import Application, MessageHandler, CommandHandler, filters
-from telegram.error import TelegramError
+from telegram.error import ChatMigrated, Forbidden, RetryAfter, TelegramError
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 import google.generativeai as genai
 import config
 import json
 import os
+from urllib.parse import quote as quote_url
 
 # Twitter API (tweepy)
 try:
@@ -39,6 +54,120 @@ logger = logging.getLogger(__name__)
 BOT_TOKEN = config.BOT_TOKEN
 CHAT_ID = config.CHAT_ID
 
+# HTTP连接池配置（旧版config.py没有这些项时使用默认值）
+HTTP_POOL_LIMIT = getattr(config, 'HTTP_POOL_LIMIT', 50)
+HTTP_LIMIT_PER_HOST = getattr(config, 'HTTP_LIMIT_PER_HOST', 6)
+HTTP_DNS_CACHE_TTL = getattr(config, 'HTTP_DNS_CACHE_TTL', 300)
+HTTP_KEEPALIVE_TIMEOUT = getattr(config, 'HTTP_KEEPALIVE_TIMEOUT', 60)
+
+# 行情缓存配置: 各数据源的有效期（秒），过期后先用旧值并在后台刷新
+QUOTE_CACHE_DEFAULT_TTL = 60
+QUOTE_CACHE_TTL = getattr(config, 'QUOTE_CACHE_TTL', {'yahoo': 60, 'eastmoney': 30, 'fx168': 60})
+QUOTE_CACHE_MAX_STALE = getattr(config, 'QUOTE_CACHE_MAX_STALE', 6 * 3600)  # 超过此时长的旧数据不再使用
+
+# 行情看板: 后台按各数据源的节奏刷新缓存，/price 命令直接读取（略短于缓存有效期，看板上的数据不会过期）
+QUOTE_BOARD_ENABLED = getattr(config, 'QUOTE_BOARD_ENABLED', True)
+QUOTE_BOARD_INTERVALS = getattr(config, 'QUOTE_BOARD_INTERVALS', {'yahoo': 45, 'eastmoney': 20, 'fx168': 45})  # 刷新间隔（秒）
+PRICE_COMMAND_COOLDOWN = getattr(config, 'PRICE_COMMAND_COOLDOWN', 10)  # 同一群组重复查询的冷却时间（秒）
+ALERT_MAX_PER_CHAT = getattr(config, 'ALERT_MAX_PER_CHAT', 20)  # 每个群组最多设置的价格提醒数
+
+# 行情历史存储（SQLite）
+QUOTE_HISTORY_ENABLED = getattr(config, 'QUOTE_HISTORY_ENABLED', True)
+QUOTE_HISTORY_FILE = getattr(config, 'QUOTE_HISTORY_FILE', 'quotes.db')
+QUOTE_HISTORY_RAW_DAYS = getattr(config, 'QUOTE_HISTORY_RAW_DAYS', 7)  # 原始数据保留天数，更早的降采样为小时K线
+QUOTE_HISTORY_KEEP_DAYS = getattr(config, 'QUOTE_HISTORY_KEEP_DAYS', 365)  # 小时K线保留天数
+QUOTE_HISTORY_BATCH_SIZE = getattr(config, 'QUOTE_HISTORY_BATCH_SIZE', 200)  # 每批最多写入的条数
+QUOTE_HISTORY_FLUSH_INTERVAL = getattr(config, 'QUOTE_HISTORY_FLUSH_INTERVAL', 5)  # 最长写入间隔（秒）
+
+# 价格推送截止时间: 超过该时间仍未返回的数据源先占位，返回后再编辑消息补上
+PRICE_PUSH_DEADLINE = getattr(config, 'PRICE_PUSH_DEADLINE', 3)
+PRICE_PUSH_EDIT_LATE = getattr(config, 'PRICE_PUSH_EDIT_LATE', True)
+PRICE_PUSH_LATE_WINDOW = getattr(config, 'PRICE_PUSH_LATE_WINDOW', 30)  # 最多等待迟到数据的时间（秒）
+
+# 推文镜像竞速配置
+TWITTER_RSS_BRIDGE_INSTANCES = getattr(config, 'TWITTER_RSS_BRIDGE_INSTANCES', [
+    "https://rss-bridge.org/bridge01/",
+    "https://wtf.roflcopter.fr/rss-bridge/",
+])
+TWEET_RACE_ENABLED = getattr(config, 'TWEET_RACE_ENABLED', True)  # 关闭后按排名逐个尝试
+TWEET_RACE_FANOUT = getattr(config, 'TWEET_RACE_FANOUT', 3)  # 同时请求的镜像数量
+TWEET_HEDGE_DELAY = getattr(config, 'TWEET_HEDGE_DELAY', 0.5)  # 追加下一个镜像前的等待时间（秒），0表示同时发出
+SENT_TWEETS_KEEP = getattr(config, 'SENT_TWEETS_KEEP', 500)  # 每个账号保留的已发送推文ID数量
+TWEET_MIRROR_CONCURRENCY = getattr(config, 'TWEET_MIRROR_CONCURRENCY', 2)  # 每个镜像同时进行的请求数上限
+
+# 推特监控账号: 每个账号可以有自己的检查间隔（分钟）和推送群组，未配置时监控 TRUMP_TWITTER_USERNAME
+TWITTER_ACCOUNTS = [
+    {
+        'username': account['username'],
+        'interval': account.get('interval', config.TRUMP_CHECK_INTERVAL),
+        'chat_id': str(account.get('chat_id', CHAT_ID)),
+    }
+    for account in getattr(config, 'TWITTER_ACCOUNTS', [{'username': config.TRUMP_TWITTER_USERNAME}])
+]
+
+# 财经新闻过滤关键词（金十快讯 / 东方财富备用源），可在config.py中扩充
+NEWS_KEYWORDS = getattr(config, 'NEWS_KEYWORDS', [
+    '金价', '黄金', '美元', '原油', 'WTI', '布伦特', '比特币', 'BTC',
+    '以太坊', 'ETH', '上证', '纳斯达克', '道琼斯', '恒生', '股市',
+    '加密货币', '外汇', '人民币', 'CNY', '美联储', 'Fed', '央行',
+    '通胀', 'CPI', 'GDP', '利率', '美债', '大盘', '指数',
+    '涨', '跌', '市场', '金银'
+])
+EASTMONEY_NEWS_KEYWORDS = getattr(config, 'EASTMONEY_NEWS_KEYWORDS', [
+    '黄金', '美元', '原油', '比特币', '以太坊', '上证', '纳指',
+    '道指', '恒生', '股市', '外汇', '人民币', '美联储', '央行',
+    '通胀', 'CPI', 'GDP', '利率', '债券', '加密', '币', '金价'
+])
+
+# 金十快讯增量抓取配置
+NEWS_INGEST_ENABLED = getattr(config, 'NEWS_INGEST_ENABLED', True)
+NEWS_POLL_INTERVAL = getattr(config, 'NEWS_POLL_INTERVAL', 120)  # 拉取间隔（秒）
+NEWS_BUFFER_SIZE = getattr(config, 'NEWS_BUFFER_SIZE', 200)  # 内存中保留的快讯数量
+NEWS_DEDUP_THRESHOLD = getattr(config, 'NEWS_DEDUP_THRESHOLD', 0.7)  # 近似重复判定的相似度阈值（0~1）
+
+# AI问答缓存配置
+AI_CACHE_SIZE = getattr(config, 'AI_CACHE_SIZE', 256)  # 最多缓存的回答数量
+AI_CACHE_TTL = getattr(config, 'AI_CACHE_TTL', 600)  # 回答缓存有效期（秒）
+
+# AI工作池配置
+AI_WORKERS = getattr(config, 'AI_WORKERS', 2)  # 同时进行的Gemini调用数
+AI_QUEUE_LIMIT = getattr(config, 'AI_QUEUE_LIMIT', 20)  # 排队的提问总数上限，超出时提示稍后再试
+AI_USER_QUEUE_LIMIT = getattr(config, 'AI_USER_QUEUE_LIMIT', 1)  # 每个用户同时排队的提问数上限
+AI_RETRY_ATTEMPTS = getattr(config, 'AI_RETRY_ATTEMPTS', 3)  # 遇到429限流时的重试次数
+AI_RETRY_BASE_DELAY = getattr(config, 'AI_RETRY_BASE_DELAY', 2)  # 首次重试等待时间（秒），之后每次翻倍
+
+# AI流式回答配置
+AI_STREAM_ENABLED = getattr(config, 'AI_STREAM_ENABLED', True)  # 边生成边编辑"正在思考"消息
+AI_STREAM_EDIT_INTERVAL = getattr(config, 'AI_STREAM_EDIT_INTERVAL', 1.0)  # 两次编辑的最短间隔（秒）
+AI_STREAM_EDIT_CHARS = getattr(config, 'AI_STREAM_EDIT_CHARS', 150)  # 新增字数达到该值时提前编辑
+
+# AI问答行情上下文配置
+AI_GROUNDING_ENABLED = getattr(config, 'AI_GROUNDING_ENABLED', True)  # 提问时附上缓存中的相关行情和快讯
+AI_CONTEXT_MAX_CHARS = getattr(config, 'AI_CONTEXT_MAX_CHARS', 600)  # 附加上下文的字数上限
+AI_CONTEXT_NEWS_LIMIT = getattr(config, 'AI_CONTEXT_NEWS_LIMIT', 3)  # 最多附加的快讯条数
+AI_CONTEXT_NEWS_CHARS = getattr(config, 'AI_CONTEXT_NEWS_CHARS', 120)  # 每条快讯最多保留的字数
+
+# 接收消息方式: polling=长轮询, webhook=内置服务器接收Telegram推送
+TELEGRAM_MODE = getattr(config, 'TELEGRAM_MODE', 'polling')
+WEBHOOK_URL = getattr(config, 'WEBHOOK_URL', '')  # Telegram推送的公网地址（https）
+WEBHOOK_SECRET_TOKEN = getattr(config, 'WEBHOOK_SECRET_TOKEN', '')  # 校验请求来源的密钥
+WEBHOOK_LISTEN = getattr(config, 'WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PATH = getattr(config, 'WEBHOOK_PATH', '/telegram')
+WEBHOOK_MAX_CONNECTIONS = getattr(config, 'WEBHOOK_MAX_CONNECTIONS', 40)  # Telegram同时推送的连接数
+WEBHOOK_MAX_BODY = 1024 * 1024
+WEBHOOK_SECRET_TOKEN_RE = re.compile(r'[A-Za-z0-9_-]{1,256}')  # Telegram允许的密钥字符
+# 多进程部署时每个进程单独指定端口和角色（环境变量优先）:
+# primary=负责定时任务、注册webhook和刷新行情看板, worker=只处理收到的消息（行情读取primary写入的快照）
+WEBHOOK_PORT = int(os.environ.get('WEBHOOK_PORT', getattr(config, 'WEBHOOK_PORT', 8443)))
+WEBHOOK_ROLE = os.environ.get('WEBHOOK_ROLE', getattr(config, 'WEBHOOK_ROLE', 'primary'))
+
+# 多群组推送限速（Telegram限制：整体约30条/秒，同一群组约20条/分钟）
+FANOUT_GLOBAL_RATE = getattr(config, 'FANOUT_GLOBAL_RATE', 25)  # 每秒最多发送的消息数
+FANOUT_CHAT_RATE = getattr(config, 'FANOUT_CHAT_RATE', 1 / 3)  # 每个群组每秒最多发送的消息数
+FANOUT_CHAT_BURST = getattr(config, 'FANOUT_CHAT_BURST', 3)  # 每个群组允许的突发条数
+FANOUT_CONCURRENCY = getattr(config, 'FANOUT_CONCURRENCY', 20)  # 同时进行的发送请求数
+FANOUT_RETRIES = getattr(config, 'FANOUT_RETRIES', 3)  # 触发限流（RetryAfter）后的重试次数
+
 # 初始化机器人
 bot = Bot(token=BOT_TOKEN)
 
@@ -47,542 +176,1500 @@ if config.AI_ENABLED:
     genai.configure(api_key=config.GEMINI_API_KEY)
     gemini_model = genai.GenerativeModel(config.GEMINI_MODEL)
 
-# 川普推特监控 - 存储已发送的推文ID
-SENT_TWEETS_FILE = "sent_tweets.json"
-sent_tweet_ids = set()
+# 推特监控 - 已发送推文ID去重存储
+SENT_TWEETS_FILE = "sent_tweets.log"
+LEGACY_SENT_TWEETS_FILE = "sent_tweets.json"
 
-def load_sent_tweets():
-    """从文件加载已发送的推文ID"""
-    global sent_tweet_ids
-    try:
-        if os.path.exists(SENT_TWEETS_FILE):
-            with open(SENT_TWEETS_FILE, 'r') as f:
-                sent_tweet_ids = set(json.load(f))
-                logger.info(f"已加载 {len(sent_tweet_ids)} 个已发送推文ID")
-    except Exception as e:
-        logger.error(f"加载已发送推文ID失败: {e}")
-        sent_tweet_ids = set()
 
-def save_sent_tweets():
-    """保存已发送的推文ID到文件"""
-    try:
-        # 只保留最近100个ID，避免文件过大
-        tweets_to_save = list(sent_tweet_ids)[-100:]
-        with open(SENT_TWEETS_FILE, 'w') as f:
-            json.dump(tweets_to_save, f)
-    except Exception as e:
-        logger.error(f"保存已发送推文ID失败: {e}")
+class SentTweetStore:
+    """按账号记录已发送的推文ID
 
+    内存中每个账号一个按插入顺序排列的有界字典，成员判断为O(1)；
+    磁盘上是只追加的日志文件（每行"账号<TAB>推文ID"），每次新增只追加一行，
+    日志行数超过保留数量的两倍时重写压缩。
+    """
 
-async def get_gold_price():
-    """获取伦敦金价格 - 使用fx168news.com"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            # 使用fx168news.com作为数据源
-            url = "https://www.fx168news.com/quote/XAU"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
-            }
-            
-            async with session.get(url, headers=headers, timeout=15) as response:
-                if response.status == 200:
-                    html = await response.text()
-                    
-                    # 解析JSON数据 (页面包含Next.js数据)
-                    import json
-                    import re
-                    
-                    # 提取JSON数据
-                    pattern = r'"infoListData":\[({[^}]+})\]'
-                    match = re.search(pattern, html)
-                    
-                    if match:
-                        try:
-                            info_data = json.loads(match.group(1))
-                            
-                            price = float(info_data.get('tradePrice', 0))
-                            prev_close = float(info_data.get('preClosePrice', 0))
-                            range_percent = info_data.get('rangePercent', '')
-                            
-                            if price > 0 and prev_close > 0:
-                                # 解析涨跌幅
-                                change_pct = ((price - prev_close) / prev_close) * 100
-                                
-                                # 检查市场状态
-                                current_weekday = datetime.now().weekday()
-                                market_status = ""
-                                if current_weekday >= 5:  # 周末
-                                    market_status = " [周五收盘]"
-                                
-                                change_symbol = "📈" if change_pct >= 0 else "📉"
-                                return f"💰 伦敦金: ${price:.2f}/盎司{market_status} {change_symbol}{change_pct:+.2f}%"
-                        except (json.JSONDecodeError, ValueError) as e:
-                            logger.error(f"解析fx168数据失败: {e}")
-                    
-                return "💰 伦敦金: --"
-    except Exception as e:
-        logger.error(f"获取伦敦金价格失败: {e}")
-        return "💰 伦敦金: --"
+    def __init__(self, path, keep):
+        self.path = path
+        self.keep = keep
+        self._ids = {}
+        self._log_lines = 0
 
+    def load(self, legacy_path=None, legacy_account=''):
+        """从日志文件加载；日志不存在时从旧版JSON文件迁移"""
+        self._ids = {}
+        self._log_lines = 0
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        # 崩溃时可能留下不完整的最后一行，直接忽略
+                        if not line.endswith('\n'):
+                            break
+                        account, _, tweet_id = line.rstrip('\n').partition('\t')
+                        if tweet_id.isdigit():
+                            self._remember(account, tweet_id)
+                        self._log_lines += 1
+            elif legacy_path and os.path.exists(legacy_path):
+                with open(legacy_path, 'r') as f:
+                    for tweet_id in json.load(f):
+                        if str(tweet_id).isdigit():
+                            self._remember(legacy_account, str(tweet_id))
+                logger.info(f"已从 {legacy_path} 迁移已发送推文ID")
+            self.compact()
+            logger.info(f"已加载 {len(self)} 个已发送推文ID")
+        except Exception as e:
+            logger.error(f"加载已发送推文ID失败: {e}")
 
-async def get_dollar_index():
-    """获取美元指数"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            # 使用Yahoo Finance API
-            url = "https://query1.finance.yahoo.com/v8/finance/chart/DX-Y.NYB"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
-            }
-            
-            async with session.get(url, headers=headers, timeout=15) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data.get('chart') and data['chart'].get('result'):
-                        result = data['chart']['result'][0]
-                        meta = result.get('meta', {})
-                        price = meta.get('regularMarketPrice')
-                        prev_close = meta.get('chartPreviousClose')
-                        if price and prev_close:
-                            change_pct = ((price - prev_close) / prev_close) * 100
-                            change_symbol = "📈" if change_pct >= 0 else "📉"
-                            return f"💵 美元指数: {price:.2f} {change_symbol}{change_pct:+.2f}%"
-                logger.warning(f"美元指数API返回数据格式异常")
-                return "💵 美元指数: --"
-    except asyncio.TimeoutError:
-        logger.error("获取美元指数超时")
-        return "💵 美元指数: 超时"
-    except Exception as e:
-        logger.error(f"获取美元指数失败: {e}")
-        return "💵 美元指数: --"
+    def __len__(self):
+        return sum(len(ids) for ids in self._ids.values())
 
+    def contains(self, account, tweet_id):
+        """推文是否已发送过"""
+        return tweet_id in self._ids.get(account, ())
 
-async def get_oil_price():
-    """获取原油价格（WTI）"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            # 使用Yahoo Finance获取WTI原油期货价格
-            url = "https://query1.finance.yahoo.com/v8/finance/chart/CL=F"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
-            }
-            
-            async with session.get(url, headers=headers, timeout=15) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data.get('chart') and data['chart'].get('result'):
-                        result = data['chart']['result'][0]
-                        meta = result.get('meta', {})
-                        price = meta.get('regularMarketPrice')
-                        prev_close = meta.get('chartPreviousClose')
-                        if price and prev_close:
-                            change_pct = ((price - prev_close) / prev_close) * 100
-                            change_symbol = "📈" if change_pct >= 0 else "📉"
-                            return f"🛢️ WTI原油: ${price:.2f} {change_symbol}{change_pct:+.2f}%"
-                logger.warning("原油价格API返回数据格式异常")
-                return "🛢️ WTI原油: --"
-    except asyncio.TimeoutError:
-        logger.error("获取原油价格超时")
-        return "🛢️ WTI原油: 超时"
-    except Exception as e:
-        logger.error(f"获取原油价格失败: {e}")
-        return "🛢️ WTI原油: --"
+    def add(self, account, tweet_id):
+        """记录一条已发送的推文，并追加写入日志"""
+        if self.contains(account, tweet_id):
+            return
+        self._remember(account, tweet_id)
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(f"{account}\t{tweet_id}\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._log_lines += 1
+        except Exception as e:
+            logger.error(f"保存已发送推文ID失败: {e}")
+        if self._log_lines > 2 * max(len(self), self.keep):
+            self.compact()
 
+    def compact(self):
+        """把内存中保留的ID重写为新日志，先写临时文件再原子替换"""
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for account, ids in self._ids.items():
+                    for tweet_id in ids:
+                        f.write(f"{account}\t{tweet_id}\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._log_lines = len(self)
+        except Exception as e:
+            logger.error(f"压缩已发送推文记录失败: {e}")
 
-async def get_usdcny_rate():
-    """获取美元兑人民币汇率"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            # 使用Yahoo Finance获取USD/CNY汇率
-            url = "https://query1.finance.yahoo.com/v8/finance/chart/CNY=X"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
-            }
-            
-            async with session.get(url, headers=headers, timeout=15) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data.get('chart') and data['chart'].get('result'):
-                        result = data['chart']['result'][0]
-                        meta = result.get('meta', {})
-                        price = meta.get('regularMarketPrice')
-                        prev_close = meta.get('chartPreviousClose')
-                        if price and prev_close:
-                            change_pct = ((price - prev_close) / prev_close) * 100
-                            change_symbol = "📈" if change_pct >= 0 else "📉"
-                            return f"💴 美元/人民币: ¥{price:.4f} {change_symbol}{change_pct:+.2f}%"
-                logger.warning("USD/CNY汇率API返回数据格式异常")
-                return "💴 美元/人民币: --"
-    except asyncio.TimeoutError:
-        logger.error("获取USD/CNY汇率超时")
-        return "💴 美元/人民币: 超时"
-    except Exception as e:
-        logger.error(f"获取USD/CNY汇率失败: {e}")
-        return "💴 美元/人民币: --"
+    def _remember(self, account, tweet_id):
+        """加入内存记录，超出保留数量时丢弃最早的ID"""
+        ids = self._ids.setdefault(account, {})
+        ids.pop(tweet_id, None)
+        ids[tweet_id] = None
+        while len(ids) > self.keep:
+            del ids[next(iter(ids))]
+
+
+sent_tweet_store = SentTweetStore(SENT_TWEETS_FILE, SENT_TWEETS_KEEP)
+
+# 各监控账号下次检查的时间（time.monotonic）
+twitter_next_check = {}
 
 
-async def get_shanghai_gold_price():
-    """获取上海金价格 - 从东方财富网API获取"""
+# 后台任务 - 保存引用，避免任务在完成前被垃圾回收
+background_tasks = set()
+
+def create_background_task(coro):
+    """启动一个不需要等待结果的后台任务"""
+    task = asyncio.ensure_future(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+# 价格推送中各数据源错过截止时间的次数
+price_deadline_misses = {}
+
+
+# 订阅 - 各群组接收哪些定时推送
+SUBSCRIPTIONS_FILE = "subscriptions.json"
+FEEDS = {
+    'price': '价格推送',
+    'calendar': '财经日历',
+    'news': '财经简报',
+    'tweets': '推特监控',
+}
+
+
+def file_signature(path):
+    """文件的 (inode, 修改时间)，文件不存在时返回None；原子替换后inode也会变化"""
     try:
-        async with aiohttp.ClientSession() as session:
-            # 使用东方财富网API获取上海金实时行情
-            url = "https://push2.eastmoney.com/api/qt/stock/get"
-            params = {
-                'secid': '118.SHAU',  # 上海黄金交易所-上海金
-                'fields': 'f43,f44,f45,f46,f60,f169,f170',
-                'ut': 'fa5fd1943c7b386f172d6893dbfba10b'
-            }
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
-                'Referer': 'https://quote.eastmoney.com/'
-            }
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns)
+
+
+# 多进程部署时共享文件的检查间隔（秒），其他进程的修改最迟这么久后生效
+SHARED_FILE_CHECK_INTERVAL = 1
+
+
+class SubscriptionRegistry:
+    """订阅登记：群组ID -> {'feeds': {推送类型: [只接收这些整点的推送] 或 None}}
+
+    整点按推送类型分别设置，只限制对应的推送。保存在JSON文件中，按推送类型建立索引，推送时直接取出订阅的群组。
+    多进程部署时文件是唯一的数据来源：读取前发现文件被其他进程修改过就重新加载，
+    修改前总是先同步文件，避免用过时的内存数据覆盖其他进程的订阅。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.chats = {}
+        self._by_feed = {}
+        self._signature = None
+        self._checked_at = 0
+
+    def __contains__(self, chat_id):
+        self.refresh()
+        return chat_id in self.chats
+
+    def load(self, default_chat_id):
+        """加载订阅；文件不存在时让 CHAT_ID 订阅原有的推送"""
+        try:
+            if os.path.exists(self.path):
+                self._read()
+            else:
+                # 推特推送默认发到各账号配置的chat_id，这里不重复订阅
+                self.chats = {default_chat_id: {'feeds': {'price': None, 'calendar': None, 'news': None}}}
+                self._reindex()
+                self.save()
+            logger.info(f"已加载 {len(self.chats)} 个群组的订阅")
+        except Exception as e:
+            logger.error(f"加载订阅失败: {e}")
+
+    def _read(self):
+        signature = file_signature(self.path)
+        with open(self.path, 'r', encoding='utf-8') as f:
+            chats = json.load(f)
+        for subscription in chats.values():
+            feeds = subscription['feeds']
+            if isinstance(feeds, list):
+                # 旧格式: {'feeds': [推送类型], 'hours': 整点} - 整点原先对所有推送生效
+                hours = subscription.pop('hours', None)
+                subscription['feeds'] = {feed: hours for feed in feeds}
+        self.chats = chats
+        self._reindex()
+        self._signature = signature
+
+    def refresh(self, force=False):
+        """订阅文件被其他进程修改过时重新加载；不带force时每秒最多检查一次"""
+        now = time.monotonic()
+        if not force and now - self._checked_at < SHARED_FILE_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        signature = file_signature(self.path)
+        if signature is None or signature == self._signature:
+            return
+        try:
+            self._read()
+            logger.info(f"订阅文件已更新，重新加载 {len(self.chats)} 个群组的订阅")
+        except Exception as e:
+            logger.error(f"重新加载订阅失败: {e}")
+
+    def save(self):
+        """先写临时文件再原子替换"""
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.chats, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+            self._signature = file_signature(self.path)
+        except Exception as e:
+            logger.error(f"保存订阅失败: {e}")
+
+    def _reindex(self):
+        self._by_feed = {feed: [] for feed in FEEDS}
+        for chat_id, subscription in self.chats.items():
+            for feed in subscription['feeds']:
+                self._by_feed.setdefault(feed, []).append(chat_id)
+
+    def subscribe(self, chat_id, feeds, hours=None):
+        """订阅推送，返回该群组的订阅
+
+        指定hours时这些推送只在这些整点接收；不指定时取消这些推送原有的整点限制。
+        """
+        self.refresh(force=True)
+        subscription = self.chats.setdefault(chat_id, {'feeds': {}})
+        for feed in feeds:
+            subscription['feeds'][feed] = sorted(set(hours)) if hours else None
+        self._reindex()
+        self.save()
+        return subscription
+
+    def unsubscribe(self, chat_id, feeds=None):
+        """取消订阅，不指定推送类型时取消全部，返回剩余的订阅"""
+        self.refresh(force=True)
+        subscription = self.chats.get(chat_id)
+        if subscription is None:
+            return None
+        for feed in feeds or ():
+            subscription['feeds'].pop(feed, None)
+        if not feeds or not subscription['feeds']:
+            del self.chats[chat_id]
+            subscription = None
+        self._reindex()
+        self.save()
+        return subscription
+
+    def migrate(self, old_chat_id, new_chat_id):
+        """群组升级为超级群组后ID会变化"""
+        self.refresh(force=True)
+        if old_chat_id in self.chats:
+            self.chats[new_chat_id] = self.chats.pop(old_chat_id)
+            self._reindex()
+            self.save()
+
+    def chats_for(self, feed, hour=None):
+        """订阅了某类推送的群组；指定hour时排除不接收这个整点推送的群组"""
+        self.refresh()
+        chat_ids = self._by_feed.get(feed, [])
+        if hour is None:
+            return list(chat_ids)
+        return [
+            chat_id for chat_id in chat_ids
+            for hours in [self.chats[chat_id]['feeds'][feed]]
+            if not hours or hour in hours
+        ]
+
+
+subscription_registry = SubscriptionRegistry(SUBSCRIPTIONS_FILE)
+
+
+class TokenBucket:
+    """令牌桶限速（预订式：令牌可以透支，透支多少就等待多久，先到先得）"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def reserve(self):
+        """预订一个令牌，返回需要等待的秒数"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    async def acquire(self):
+        blocked = self.blocked_until - time.monotonic()
+        if blocked > 0:
+            await asyncio.sleep(blocked)
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds):
+        """接下来seconds秒内不放行（收到RetryAfter时使用）"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class FanoutSender:
+    """把同一条消息发送到多个群组
+
+    全局和每个群组各有一个令牌桶，满足Telegram的整体限速和单群限速；
+    某个群组触发RetryAfter时只有这个群组等待重试，其余群组继续发送。
+    """
+
+    def __init__(self, global_rate, chat_rate, chat_burst, concurrency, retries):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.retries = retries
+        self._chat_buckets = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def send(self, chat_ids, text, **kwargs):
+        """发送到所有群组，返回 {群组ID: 已发送的Message}（失败的群组不在其中）"""
+        chat_ids = list(dict.fromkeys(chat_ids))
+        results = await asyncio.gather(*(
+            self._deliver(chat_id, lambda target: bot.send_message(chat_id=target, text=text, **kwargs))
+            for chat_id in chat_ids
+        ))
+        return {chat_id: message for chat_id, message in results if message is not None}
+
+    async def edit(self, messages, text, **kwargs):
+        """编辑 send 返回的各群组消息"""
+        def edit_call(message_id):
+            return lambda target: bot.edit_message_text(chat_id=target, message_id=message_id, text=text, **kwargs)
+        
+        await asyncio.gather(*(
+            self._deliver(chat_id, edit_call(message.message_id))
+            for chat_id, message in messages.items()
+        ))
+
+    async def _deliver(self, chat_id, call):
+        """按限速发送到一个群组，处理限流、群组迁移和被移出群组
+
+        返回 (实际发送的群组ID, 结果)，失败时结果为None。
+        """
+        for attempt in range(self.retries + 1):
+            await self._chat_bucket(chat_id).acquire()
+            await self.global_bucket.acquire()
+            try:
+                async with self._semaphore:
+                    return chat_id, await call(chat_id)
+            except RetryAfter as e:
+                logger.warning(f"发送到 {chat_id} 触发限流，{e.retry_after}秒后重试 ({attempt + 1}/{self.retries})")
+                self._chat_bucket(chat_id).pause(e.retry_after)
+            except ChatMigrated as e:
+                new_chat_id = str(e.new_chat_id)
+                logger.info(f"群组 {chat_id} 已迁移为 {new_chat_id}")
+                subscription_registry.migrate(chat_id, new_chat_id)
+                chat_id = new_chat_id
+            except Forbidden as e:
+                logger.warning(f"无法发送到 {chat_id}，取消该群组的订阅: {e}")
+                subscription_registry.unsubscribe(chat_id)
+                return chat_id, None
+            except TelegramError as e:
+                logger.error(f"发送到 {chat_id} 失败: {e}")
+                return chat_id, None
+        logger.error(f"发送到 {chat_id} 多次限流，放弃")
+        return chat_id, None
+
+
+fanout_sender = FanoutSender(FANOUT_GLOBAL_RATE, FANOUT_CHAT_RATE, FANOUT_CHAT_BURST, FANOUT_CONCURRENCY, FANOUT_RETRIES)
+
+
+# 共享HTTP客户端 - 所有行情、新闻、推文请求复用同一个连接池
+http_session = None
+
+def get_http_session():
+    """获取共享的aiohttp会话，不存在或已关闭时重新创建"""
+    global http_session
+    if http_session is None or http_session.closed:
+        # 按主机复用keep-alive连接，并缓存DNS解析结果
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT
+        )
+        http_session = aiohttp.ClientSession(connector=connector)
+        logger.info(f"HTTP连接池已创建 (总连接数: {HTTP_POOL_LIMIT}, 每主机: {HTTP_LIMIT_PER_HOST})")
+    return http_session
+
+async def close_http_session():
+    """关闭共享的aiohttp会话"""
+    global http_session
+    if http_session is not None and not http_session.closed:
+        await http_session.close()
+        logger.info("HTTP连接池已关闭")
+    http_session = None
+
+
+# 行情数据记录
+class Quote:
+    """单个品种的行情数据（各数据源统一返回此结构，显示格式由 render_quote 负责）
+
+    market_state: 数据源给出的市场状态，如 REGULAR / CLOSED，未知时为空字符串
+    latency: 获取这条行情的请求耗时（秒），由行情缓存写入
+    """
+    __slots__ = ('symbol', 'price', 'prev_close', 'change', 'change_pct', 'market_state', 'source', 'fetched_at', 'latency')
+
+    def __init__(self, symbol, price, prev_close, change_pct=None, market_state='', source=''):
+        self.symbol = symbol
+        self.price = price
+        self.prev_close = prev_close
+        self.change = price - prev_close if price and prev_close else 0.0
+        if change_pct is None and price and prev_close:
+            change_pct = ((price - prev_close) / prev_close) * 100
+        self.change_pct = change_pct
+        self.market_state = market_state
+        self.source = source
+        self.fetched_at = time.time()
+        self.latency = 0.0
+
+    def __repr__(self):
+        return f"Quote({self.symbol!r}, price={self.price}, prev_close={self.prev_close}, source={self.source!r})"
+
+
+# 行情缓存 - 按 (数据源, 代码) 缓存最近一次成功的行情
+# 多进程部署时primary进程刷新行情看板后写入快照文件，worker进程只读取快照，不请求数据源
+QUOTE_SNAPSHOT_FILE = "quote_snapshot.json"
+QUOTE_SNAPSHOT_FIELDS = ('symbol', 'price', 'prev_close', 'change_pct', 'market_state', 'source', 'fetched_at', 'latency')
+
+
+class QuoteCache:
+    """行情缓存，过期数据先返回，同时在后台刷新 (stale-while-revalidate)"""
+
+    def __init__(self, ttl, max_stale):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._entries = {}
+        self._inflight = {}
+        self.listeners = []  # 每写入一条新行情时调用 listener(quote)
+        self._snapshot_path = None
+        self._snapshot_signature = None
+        self._snapshot_checked_at = 0
+
+    def get(self, source, symbol):
+        """读取缓存（不触发请求），超过最长保留时间的数据视为不存在"""
+        if self._snapshot_path is not None:
+            self._sync_snapshot()
+        quote = self._entries.get((source, symbol))
+        if quote is None or time.time() - quote.fetched_at > self.max_stale:
+            return None
+        return quote
+
+    def put(self, quote):
+        """写入一条刚获取的行情，再通知监听函数"""
+        quote.fetched_at = time.time()
+        self._entries[(quote.source, quote.symbol)] = quote
+        self._notify(quote)
+
+    def _notify(self, quote):
+        """逐个调用监听函数；某个监听函数出错只记录日志，不影响缓存和其他监听函数"""
+        for listener in self.listeners:
+            try:
+                listener(quote)
+            except Exception as e:
+                logger.error(f"行情监听 {getattr(listener, '__qualname__', listener)} 处理 {quote.symbol} 失败: {e}")
+
+    def save_snapshot(self, path):
+        """把缓存中的全部行情写入快照文件（先写临时文件再原子替换）"""
+        tmp_path = path + '.tmp'
+        try:
+            rows = [[getattr(quote, field) for field in QUOTE_SNAPSHOT_FIELDS] for quote in self._entries.values()]
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(rows, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"保存行情快照失败: {e}")
+
+    def follow_snapshot(self, path):
+        """worker进程: 读取缓存时从primary进程写入的快照同步"""
+        self._snapshot_path = path
+
+    def _sync_snapshot(self):
+        """快照文件被primary进程更新过时重新加载；每秒最多检查一次"""
+        now = time.monotonic()
+        if now - self._snapshot_checked_at < SHARED_FILE_CHECK_INTERVAL:
+            return
+        self._snapshot_checked_at = now
+        signature = file_signature(self._snapshot_path)
+        if signature is None or signature == self._snapshot_signature:
+            return
+        try:
+            with open(self._snapshot_path, 'r', encoding='utf-8') as f:
+                rows = json.load(f)
+            for row in rows:
+                fields = dict(zip(QUOTE_SNAPSHOT_FIELDS, row))
+                quote = Quote(fields['symbol'], fields['price'], fields['prev_close'],
+                              fields['change_pct'], fields['market_state'], fields['source'])
+                quote.fetched_at = fields['fetched_at']
+                quote.latency = fields['latency']
+                self._entries[(quote.source, quote.symbol)] = quote
+            self._snapshot_signature = signature
+        except Exception as e:
+            logger.error(f"读取行情快照失败: {e}")
+
+    def is_stale(self, quote):
+        """行情是否已超过所属数据源的有效期"""
+        ttl = self.ttl.get(quote.source, QUOTE_CACHE_DEFAULT_TTL)
+        return time.time() - quote.fetched_at > ttl
+
+    async def fetch(self, source, symbols, loader):
+        """获取一组行情，返回 {代码: Quote}
+
+        未过期的直接返回；已过期的先返回旧值并在后台刷新；
+        缓存中没有的才等待loader请求。同一品种同时只有一个请求在进行。
+        """
+        quotes = {}
+        stale = []
+        missing = []
+        for symbol in dict.fromkeys(symbols):
+            quote = self.get(source, symbol)
+            if quote is None:
+                missing.append(symbol)
+            else:
+                quotes[symbol] = quote
+                if self.is_stale(quote):
+                    stale.append(symbol)
+        
+        if stale:
+            self._start_refresh(source, stale, loader)
+        
+        if missing:
+            await self.refresh(source, missing, loader)
+            for symbol in missing:
+                quote = self.get(source, symbol)
+                if quote is not None:
+                    quotes[symbol] = quote
+        
+        return quotes
+
+    async def refresh(self, source, symbols, loader):
+        """主动刷新一组行情，已有进行中的请求时直接等待它"""
+        tasks = self._start_refresh(source, symbols, loader)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _start_refresh(self, source, symbols, loader):
+        """为没有进行中请求的品种发起一次批量刷新，返回相关的请求任务"""
+        pending = [symbol for symbol in symbols if (source, symbol) not in self._inflight]
+        if pending:
+            task = asyncio.ensure_future(self._refresh(source, pending, loader))
+            for symbol in pending:
+                self._inflight[(source, symbol)] = task
+        return {self._inflight[(source, symbol)] for symbol in symbols}
+
+    async def _refresh(self, source, symbols, loader):
+        """调用loader刷新行情并写入缓存"""
+        try:
+            started = time.monotonic()
+            quotes = await loader(symbols)
+            latency = time.monotonic() - started
+            now = time.time()
+            # 整批先写入缓存再通知监听函数
+            for quote in quotes.values():
+                quote.latency = latency
+                quote.fetched_at = now
+                self._entries[(quote.source, quote.symbol)] = quote
+            for quote in quotes.values():
+                self._notify(quote)
+        except Exception as e:
+            logger.error(f"刷新 {source} 行情失败: {e}")
+        finally:
+            for symbol in symbols:
+                self._inflight.pop((source, symbol), None)
+
+
+quote_cache = QuoteCache(QUOTE_CACHE_TTL, QUOTE_CACHE_MAX_STALE)
+
+
+class QuoteHistoryStore:
+    """行情历史（SQLite，WAL模式）
+
+    每次获取到的行情只在内存队列中入队，由后台线程批量写入，推送和命令路径不会等待磁盘。
+    原始数据保留 raw_days 天，更早的按小时降采样（开高低收）后保留 keep_days 天。
+    主键为 (数据源, 代码, 时间)，按品种和时间范围查询时只读取连续的一段。
+    """
+
+    MAINTENANCE_INTERVAL = 3600
+
+    def __init__(self, path, raw_days, keep_days, batch_size, flush_interval):
+        self.path = path
+        self.raw_days = raw_days
+        self.keep_days = keep_days
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+
+    def start(self):
+        """建表并启动写入线程"""
+        conn = self._connect()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS quotes (
+                source TEXT NOT NULL,
+                symbol TEXT NOT NULL,
+                ts INTEGER NOT NULL,
+                price REAL NOT NULL,
+                prev_close REAL,
+                PRIMARY KEY (source, symbol, ts)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS quotes_hourly (
+                source TEXT NOT NULL,
+                symbol TEXT NOT NULL,
+                ts INTEGER NOT NULL,
+                open REAL NOT NULL,
+                high REAL NOT NULL,
+                low REAL NOT NULL,
+                close REAL NOT NULL,
+                PRIMARY KEY (source, symbol, ts)
+            ) WITHOUT ROWID;
+        """)
+        conn.close()
+        self._thread = threading.Thread(target=self._run, name='quote-history', daemon=True)
+        self._thread.start()
+        logger.info(f"行情历史已启用: {self.path}")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def record(self, quote):
+        """记录一条行情（只入队，不等待写入）"""
+        if quote.price > 0:
+            self._queue.put((quote.source, quote.symbol, int(quote.fetched_at), quote.price, quote.prev_close))
+
+    def close(self):
+        """写完队列中剩余的数据后停止写入线程"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def _run(self):
+        """写入线程：攒够一批或到达刷新间隔时写入，定期降采样和清理"""
+        conn = self._connect()
+        next_maintenance = time.monotonic()
+        batch = []
+        stopping = False
+        while not stopping:
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    row = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
             
-            async with session.get(url, params=params, headers=headers, timeout=15) as response:
-                if response.status == 200:
-                    import json
-                    data = await response.json()
-                    
-                    if data.get('data'):
-                        quote = data['data']
-                        
-                        # 东方财富网价格字段说明:
-                        # f43: 最新价 (闭市时为0，单位: 分，需要除以100)
-                        # f60: 昨收价 (单位: 分，需要除以100)
-                        # f170: 涨跌幅百分比 (单位: 百分点的100倍，需要除以100)
-                        price = quote.get('f43', 0)  # 最新价
-                        prev_close = quote.get('f60', 0)  # 昨收
-                        change_pct = quote.get('f170', 0)  # 涨跌幅
-                        
-                        # 价格需要除以100转换为元/克
-                        if price > 0:
-                            price = price / 100
-                        if prev_close > 0:
-                            prev_close = prev_close / 100
-                        # 涨跌幅需要除以100转换为百分比
-                        if change_pct != 0:
-                            change_pct = change_pct / 100
-                        
-                        # 检查市场状态
-                        current_weekday = datetime.now().weekday()
-                        market_status = ""
-                        
-                        if price == 0 and prev_close > 0:
-                            # 闭市状态，显示昨收价
-                            if current_weekday >= 5:  # 周末
-                                market_status = " [周五收盘]"
-                            else:
-                                market_status = " [闭市]"
-                            return f"🏆 上海金: ¥{prev_close:.2f}/克{market_status}"
-                        elif price > 0:
-                            # 开市状态，显示实时价格
-                            change_symbol = "📈" if change_pct >= 0 else "📉"
-                            return f"🏆 上海金: ¥{price:.2f}/克 {change_symbol}{change_pct:+.2f}%"
-                        
-            return "🏆 上海金: --"
-    except Exception as e:
-        logger.error(f"获取上海金价格失败: {e}")
-        return "🏆 上海金: --"
+            try:
+                if batch:
+                    conn.executemany("INSERT OR REPLACE INTO quotes VALUES (?, ?, ?, ?, ?)", batch)
+                    conn.commit()
+                    batch = []
+                if time.monotonic() >= next_maintenance:
+                    self._maintain(conn)
+                    next_maintenance = time.monotonic() + self.MAINTENANCE_INTERVAL
+            except sqlite3.Error as e:
+                logger.error(f"写入行情历史失败: {e}")
+                batch = []
+        conn.close()
+
+    def _maintain(self, conn):
+        """把超过保留期的原始数据降采样为小时K线，删除超过总保留期的数据"""
+        now = int(time.time())
+        raw_cutoff = now - self.raw_days * 86400
+        raw_cutoff -= raw_cutoff % 3600  # 只处理完整的小时
+        
+        bars = {}
+        rows = conn.execute(
+            "SELECT source, symbol, ts, price FROM quotes WHERE ts < ? ORDER BY source, symbol, ts",
+            (raw_cutoff,)
+        )
+        for source, symbol, ts, price in rows:
+            key = (source, symbol, ts - ts % 3600)
+            bar = bars.get(key)
+            if bar is None:
+                bars[key] = [price, price, price, price]
+            else:
+                bar[1] = max(bar[1], price)
+                bar[2] = min(bar[2], price)
+                bar[3] = price
+        
+        # 同一小时可能分两次处理，已有K线时合并
+        conn.executemany(
+            """INSERT INTO quotes_hourly VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT (source, symbol, ts) DO UPDATE SET
+                   high = max(high, excluded.high),
+                   low = min(low, excluded.low),
+                   close = excluded.close""",
+            [key + tuple(bar) for key, bar in bars.items()]
+        )
+        conn.execute("DELETE FROM quotes WHERE ts < ?", (raw_cutoff,))
+        conn.execute("DELETE FROM quotes_hourly WHERE ts < ?", (now - self.keep_days * 86400,))
+        conn.commit()
+        if bars:
+            logger.info(f"行情历史降采样: {len(bars)} 根小时K线")
+
+    def query(self, source, symbol, start, end=None):
+        """查询一个品种在 [start, end] 时间范围内的价格，返回 [(时间戳, 价格)]
+
+        原始数据保留期之前的部分用小时K线的收盘价。读取使用独立连接，
+        在事件循环中请通过 asyncio.to_thread 调用。
+        """
+        end = int(time.time()) if end is None else end
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            hourly = conn.execute(
+                "SELECT ts, close FROM quotes_hourly WHERE source = ? AND symbol = ? AND ts BETWEEN ? AND ? ORDER BY ts",
+                (source, symbol, start, end)
+            ).fetchall()
+            raw = conn.execute(
+                "SELECT ts, price FROM quotes WHERE source = ? AND symbol = ? AND ts BETWEEN ? AND ? ORDER BY ts",
+                (source, symbol, start, end)
+            ).fetchall()
+        finally:
+            conn.close()
+        if hourly and raw:
+            hourly = [row for row in hourly if row[0] < raw[0][0]]
+        return hourly + raw
+
+
+quote_history = QuoteHistoryStore(
+    QUOTE_HISTORY_FILE,
+    QUOTE_HISTORY_RAW_DAYS,
+    QUOTE_HISTORY_KEEP_DAYS,
+    QUOTE_HISTORY_BATCH_SIZE,
+    QUOTE_HISTORY_FLUSH_INTERVAL
+)
 
 
-async def get_btc_price():
-    """获取BTC价格"""
+def stale_suffix(quote):
+    """过期行情在消息中标注数据时间"""
+    if quote is None or not quote_cache.is_stale(quote):
+        return ""
+    return f" [截至{datetime.fromtimestamp(quote.fetched_at).strftime('%H:%M')}]"
+
+
+# 行情数据源注册表: 数据源名称 -> 批量获取函数 loader(代码列表) -> {代码: Quote}
+# 新数据源只需写一个批量获取函数并用 @quote_source('名称') 注册，品种配置里即可引用
+QUOTE_SOURCES = {}
+
+
+def quote_source(name):
+    """注册行情数据源适配器"""
+    def register(loader):
+        QUOTE_SOURCES[name] = loader
+        return loader
+    return register
+
+
+# 品种配置（按列表顺序显示在价格消息中）- 新增品种只需在 config.py 的 INSTRUMENTS 里加一项
+# source: 数据源; symbol: 数据源中的代码（东方财富为 "市场编号.代码" 格式的secid）
+# format: 价格格式，也可以只写 decimals（小数位）及可选的 prefix/suffix
+# calendar: 24h=不标注, spot=只标注周末, index=周末及收盘, sge=上金所闭市, a_share=A股交易时段
+#           （index和a_share同时显示涨跌点数，其余只显示涨跌幅）
+# aliases: /price 查询及AI问答识别品种用的别名，不区分大小写
+DEFAULT_INSTRUMENTS = [
+    {'key': 'sse', 'source': 'eastmoney', 'symbol': '1.000001', 'name': '上证指数', 'label': '📊 上证指数',
+     'format': '{:.2f}', 'calendar': 'a_share', 'aliases': ['上证', '沪指', 'A股', '大盘']},
+    {'key': 'btc', 'source': 'yahoo', 'symbol': 'BTC-USD', 'name': 'BTC', 'label': '🪙 BTC',
+     'format': '${:,.2f}', 'calendar': '24h', 'aliases': ['BTC', '比特币', 'Bitcoin']},
+    {'key': 'eth', 'source': 'yahoo', 'symbol': 'ETH-USD', 'name': 'ETH', 'label': '💎 ETH',
+     'format': '${:,.2f}', 'calendar': '24h', 'aliases': ['ETH', '以太坊', 'Ethereum']},
+    {'key': 'gold', 'source': 'fx168', 'symbol': 'XAU', 'name': '伦敦金', 'label': '💰 伦敦金',
+     'format': '${:.2f}/盎司', 'calendar': 'spot', 'aliases': ['伦敦金', '黄金', '金价', 'XAU', 'Gold']},
+    {'key': 'sh_gold', 'source': 'eastmoney', 'symbol': '118.SHAU', 'name': '上海金', 'label': '🏆 上海金',
+     'format': '¥{:.2f}/克', 'calendar': 'sge', 'aliases': ['上海金', '黄金', '金价', 'SHAU']},
+    {'key': 'dxy', 'source': 'yahoo', 'symbol': 'DX-Y.NYB', 'name': '美元指数', 'label': '💵 美元指数',
+     'format': '{:.2f}', 'calendar': '24h', 'aliases': ['美元指数', '美指', 'DXY']},
+    {'key': 'usdcny', 'source': 'yahoo', 'symbol': 'CNY=X', 'name': 'USD/CNY汇率', 'label': '💴 美元/人民币',
+     'format': '¥{:.4f}', 'calendar': '24h', 'aliases': ['人民币', '汇率', 'USDCNY', 'CNY']},
+    {'key': 'wti', 'source': 'yahoo', 'symbol': 'CL=F', 'name': 'WTI原油', 'label': '🛢️ WTI原油',
+     'format': '${:.2f}', 'calendar': '24h', 'aliases': ['原油', '油价', 'WTI']},
+    {'key': 'nasdaq', 'source': 'yahoo', 'symbol': '^IXIC', 'name': '纳斯达克指数', 'label': '📊 纳斯达克',
+     'format': '{:,.2f}', 'calendar': 'index', 'aliases': ['纳斯达克', '纳指', 'Nasdaq']},
+    {'key': 'dow', 'source': 'yahoo', 'symbol': '^DJI', 'name': '道琼斯指数', 'label': '📊 道琼斯',
+     'format': '{:,.2f}', 'calendar': 'index', 'aliases': ['道琼斯', '道指', 'Dow']},
+    {'key': 'hsi', 'source': 'yahoo', 'symbol': '^HSI', 'name': '恒生指数', 'label': '📊 恒生指数',
+     'format': '{:,.2f}', 'calendar': 'index', 'aliases': ['恒生指数', '恒指', '港股', 'HSI']},
+    {'key': 'hstech', 'source': 'yahoo', 'symbol': 'HSTECH.HK', 'name': '恒生科技指数', 'label': '🔬 恒生科技',
+     'format': '{:,.2f}', 'calendar': 'index', 'aliases': ['恒生科技', '恒科', 'HSTECH']},
+    # {'key': 'csi300', 'source': 'eastmoney', 'symbol': '1.000300', 'name': '沪深300', 'label': '📊 沪深300', 'decimals': 2, 'calendar': 'a_share'},
+    # {'key': 'chinext', 'source': 'eastmoney', 'symbol': '0.399006', 'name': '创业板指', 'label': '📊 创业板指', 'decimals': 2, 'calendar': 'a_share'},
+    # {'key': 'au9999', 'source': 'eastmoney', 'symbol': '118.AU9999', 'name': 'Au99.99', 'label': '🏆 Au99.99', 'decimals': 2, 'prefix': '¥', 'suffix': '/克', 'calendar': 'sge'},
+]
+
+YAHOO_SPARK_URL = "https://query1.finance.yahoo.com/v7/finance/spark"
+YAHOO_CHART_URL = "https://query1.finance.yahoo.com/v8/finance/chart/{symbol}"
+YAHOO_SPARK_BATCH_SIZE = 20  # spark接口单次最多查询的代码数量
+YAHOO_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
+}
+
+
+def _parse_yahoo_meta(symbol, meta):
+    """从Yahoo chart/spark返回的meta中解析行情，数据不完整时返回None"""
+    price = meta.get('regularMarketPrice')
+    prev_close = meta.get('chartPreviousClose')
+    if not price or not prev_close:
+        return None
+    return Quote(symbol, price, prev_close, market_state=meta.get('marketState', 'CLOSED'), source='yahoo')
+
+
+async def _fetch_yahoo_spark(symbols):
+    """一次请求批量获取多个代码的行情"""
+    session = get_http_session()
+    params = {
+        'symbols': ','.join(symbols),
+        'range': '1d',
+        'interval': '1d'
+    }
+    quotes = {}
+    async with session.get(YAHOO_SPARK_URL, params=params, headers=YAHOO_HEADERS, timeout=15) as response:
+        if response.status != 200:
+            raise RuntimeError(f"HTTP {response.status}")
+        data = await response.json()
+    for item in (data.get('spark') or {}).get('result') or []:
+        for chart in item.get('response') or []:
+            quote = _parse_yahoo_meta(item.get('symbol'), chart.get('meta', {}))
+            if quote:
+                quotes[quote.symbol] = quote
+    return quotes
+
+
+async def _fetch_yahoo_chart(symbol):
+    """单个代码的chart接口，作为批量接口失败时的备用"""
+    session = get_http_session()
+    url = YAHOO_CHART_URL.format(symbol=quote_url(symbol, safe=''))
+    async with session.get(url, headers=YAHOO_HEADERS, timeout=15) as response:
+        if response.status == 200:
+            data = await response.json()
+            if data.get('chart') and data['chart'].get('result'):
+                result = data['chart']['result'][0]
+                return _parse_yahoo_meta(symbol, result.get('meta', {}))
+    return None
+
+
+@quote_source('yahoo')
+async def fetch_yahoo_quotes(symbols):
+    """批量获取Yahoo Finance行情，返回 {代码: Quote}
+
+    优先使用spark多代码接口，失败或缺失的代码再并发走chart接口。
+    """
+    symbols = list(dict.fromkeys(symbols))
+    quotes = {}
+    
+    # 品种多于一批时各批并发请求，总耗时约等于一次请求
+    batches = [symbols[i:i + YAHOO_SPARK_BATCH_SIZE] for i in range(0, len(symbols), YAHOO_SPARK_BATCH_SIZE)]
+    results = await asyncio.gather(*(_fetch_yahoo_spark(batch) for batch in batches), return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning(f"Yahoo批量行情获取失败，改用逐个请求: {result}")
+        else:
+            quotes.update(result)
+    
+    missing = [symbol for symbol in symbols if symbol not in quotes]
+    if missing:
+        results = await asyncio.gather(
+            *(_fetch_yahoo_chart(symbol) for symbol in missing),
+            return_exceptions=True
+        )
+        for symbol, result in zip(missing, results):
+            if isinstance(result, Quote):
+                quotes[symbol] = result
+            elif isinstance(result, asyncio.TimeoutError):
+                logger.error(f"获取 {symbol} 行情超时")
+            elif isinstance(result, Exception):
+                logger.error(f"获取 {symbol} 行情失败: {result}")
+            else:
+                logger.warning(f"{symbol} 行情API返回数据格式异常")
+    
+    return quotes
+
+
+EASTMONEY_ULIST_URL = "https://push2.eastmoney.com/api/qt/ulist.np/get"
+EASTMONEY_STOCK_URL = "https://push2.eastmoney.com/api/qt/stock/get"
+EASTMONEY_UT = 'fa5fd1943c7b386f172d6893dbfba10b'
+EASTMONEY_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
+    'Referer': 'https://quote.eastmoney.com/'
+}
+
+# 东方财富价格字段说明（两个接口字段编号不同，含义相同）:
+# 最新价: 列表接口f2 / 单品种接口f43 (闭市时可能为0或"-")
+# 昨收价: 列表接口f18 / 单品种接口f60
+# 涨跌幅: 列表接口f3 / 单品种接口f170 (百分点的100倍)
+# 价格小数位: 列表接口f1 / 单品种接口f59 (价格为放大10^小数位倍的整数)
+EASTMONEY_ULIST_FIELDS = {'price': 'f2', 'prev_close': 'f18', 'change_pct': 'f3', 'precision': 'f1'}
+EASTMONEY_STOCK_FIELDS = {'price': 'f43', 'prev_close': 'f60', 'change_pct': 'f170', 'precision': 'f59'}
+
+
+def _decode_eastmoney_fixed(value, precision=2):
+    """东方财富定点数转换为浮点数，"-"等无效值按0处理"""
+    if not isinstance(value, (int, float)):
+        return 0
+    return value / (10 ** precision)
+
+
+def _parse_eastmoney_quote(secid, item, fields):
+    """按字段映射解析东方财富行情"""
+    precision = item.get(fields['precision'])
+    if not isinstance(precision, int):
+        precision = 2
+    price = _decode_eastmoney_fixed(item.get(fields['price']), precision)
+    prev_close = _decode_eastmoney_fixed(item.get(fields['prev_close']), precision)
+    change_pct = _decode_eastmoney_fixed(item.get(fields['change_pct']), 2)
+    if price <= 0 and prev_close <= 0:
+        return None
+    if price <= 0:
+        # 闭市时没有最新价，按昨收价处理
+        return Quote(secid, prev_close, prev_close, change_pct=0.0, market_state='CLOSED', source='eastmoney')
+    return Quote(secid, price, prev_close, change_pct=change_pct, source='eastmoney')
+
+
+async def _fetch_eastmoney_ulist(secids):
+    """一次请求批量获取多个secid的行情"""
+    session = get_http_session()
+    fields = sorted(set(EASTMONEY_ULIST_FIELDS.values()) | {'f12', 'f13'})
+    params = {
+        'secids': ','.join(secids),
+        'fields': ','.join(fields),
+        'ut': EASTMONEY_UT
+    }
+    quotes = {}
+    async with session.get(EASTMONEY_ULIST_URL, params=params, headers=EASTMONEY_HEADERS, timeout=15) as response:
+        if response.status != 200:
+            raise RuntimeError(f"HTTP {response.status}")
+        # 接口返回的content-type不总是application/json
+        data = await response.json(content_type=None)
+    diff = (data.get('data') or {}).get('diff') or []
+    if isinstance(diff, dict):
+        diff = list(diff.values())
+    for item in diff:
+        secid = f"{item.get('f13')}.{item.get('f12')}"
+        quote = _parse_eastmoney_quote(secid, item, EASTMONEY_ULIST_FIELDS)
+        if quote:
+            quotes[secid] = quote
+    return quotes
+
+
+async def _fetch_eastmoney_stock(secid):
+    """单个secid的行情接口，作为批量接口失败时的备用"""
+    session = get_http_session()
+    params = {
+        'secid': secid,
+        'fields': ','.join(EASTMONEY_STOCK_FIELDS.values()),
+        'ut': EASTMONEY_UT
+    }
+    async with session.get(EASTMONEY_STOCK_URL, params=params, headers=EASTMONEY_HEADERS, timeout=15) as response:
+        if response.status == 200:
+            data = await response.json(content_type=None)
+            if data.get('data'):
+                return _parse_eastmoney_quote(secid, data['data'], EASTMONEY_STOCK_FIELDS)
+    return None
+
+
+@quote_source('eastmoney')
+async def fetch_eastmoney_quotes(secids):
+    """批量获取东方财富行情，返回 {secid: Quote}
+
+    优先使用列表接口一次取回全部secid，失败或缺失的再并发走单品种接口。
+    """
+    secids = list(dict.fromkeys(secids))
+    quotes = {}
+    
     try:
-        async with aiohttp.ClientSession() as session:
-            # 使用Yahoo Finance获取BTC价格和涨跌幅
-            url = "https://query1.finance.yahoo.com/v8/finance/chart/BTC-USD"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
-            }
-            
-            async with session.get(url, headers=headers, timeout=15) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data.get('chart') and data['chart'].get('result'):
-                        result = data['chart']['result'][0]
-                        meta = result.get('meta', {})
-                        price = meta.get('regularMarketPrice')
-                        prev_close = meta.get('chartPreviousClose')
-                        if price and prev_close:
-                            change_pct = ((price - prev_close) / prev_close) * 100
-                            change_symbol = "📈" if change_pct >= 0 else "📉"
-                            return f"🪙 BTC: ${price:,.2f} {change_symbol}{change_pct:+.2f}%"
-                return "🪙 BTC: --"
+        quotes.update(await _fetch_eastmoney_ulist(secids))
     except Exception as e:
-        logger.error(f"获取BTC价格失败: {e}")
-        return "🪙 BTC: --"
+        logger.warning(f"东方财富批量行情获取失败，改用逐个请求: {e}")
+    
+    missing = [secid for secid in secids if secid not in quotes]
+    if missing:
+        results = await asyncio.gather(
+            *(_fetch_eastmoney_stock(secid) for secid in missing),
+            return_exceptions=True
+        )
+        for secid, result in zip(missing, results):
+            if isinstance(result, Quote):
+                quotes[secid] = result
+            elif isinstance(result, asyncio.TimeoutError):
+                logger.error(f"获取 {secid} 行情超时")
+            elif isinstance(result, Exception):
+                logger.error(f"获取 {secid} 行情失败: {result}")
+            else:
+                logger.warning(f"{secid} 行情API返回数据格式异常")
+    
+    return quotes
+
+
+# 页面解析 - 正则在模块加载时预编译，抓取时不再重复编译
+FX168_INFO_RE = re.compile(r'"infoListData":\[({[^}]+})\]')
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+NITTER_ITEM_RE = re.compile(r'<div class="timeline-item[ "]')
+NITTER_ID_RE = re.compile(r'href="/[^/"]+/status/(\d+)')
+NITTER_DATE_RE = re.compile(r'class="tweet-date"[^>]*>\s*<a[^>]*title="([^"]+)"|class="tweet-date"[^>]*title="([^"]+)"')
+NITTER_CONTENT_RE = re.compile(r'<div class="tweet-content[^"]*"[^>]*>(.*?)</div>', re.DOTALL)
+JIN10_FLASH_RE = re.compile(r'class="flash-text">([^<]*(?:<(?!/div>)[^>]+>[^<]*)*)</div>')  # 重要快讯以<b>开头
+JIN10_ITEM_RE = re.compile(r'id="flash(\d+)"')
+NEWS_NORMALIZE_RE = re.compile(r'[\W_]+')
+NEWS_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+EASTMONEY_TITLE_RE = re.compile(r'<a[^>]+title="([^"]+)"[^>]*>(?:[^<]+)</a>')
+
+
+def clean_html_text(fragment):
+    """去除HTML标签、反转义实体并合并多余空白"""
+    return ' '.join(unescape(HTML_TAG_RE.sub('', fragment)).split())
+
+
+def parse_fx168_info(html):
+    """解析fx168行情页中的Next.js数据，返回行情字典或None"""
+    match = FX168_INFO_RE.search(html)
+    if not match:
+        return None
+    return json.loads(match.group(1))
+
+
+def parse_nitter_timeline(html, limit=5):
+    """解析Nitter时间线，返回 [(推文ID, 时间, 内容)]
+
+    按 timeline-item 分段，每段内同时取ID、时间和内容，保证三者属于同一条推文；
+    转发、回复和缺少ID或内容的条目会被跳过。
+    """
+    starts = [match.start() for match in NITTER_ITEM_RE.finditer(html)]
+    items = []
+    for i, start in enumerate(starts):
+        end = starts[i + 1] if i + 1 < len(starts) else len(html)
+        segment = html[start:end]
+        
+        id_match = NITTER_ID_RE.search(segment)
+        content_match = NITTER_CONTENT_RE.search(segment)
+        if not id_match or not content_match:
+            continue
+        # 转发带 retweet-header，回复带 replying-to（正文不一定以@开头）
+        if 'class="retweet-header"' in segment or 'class="replying-to"' in segment:
+            continue
+        
+        content = clean_html_text(content_match.group(1))
+        # 跳过转发和回复
+        if content.startswith('RT @') or content.startswith('@'):
+            continue
+        
+        date_match = NITTER_DATE_RE.search(segment)
+        tweet_time = (date_match.group(1) or date_match.group(2)) if date_match else "未知时间"
+        items.append((id_match.group(1), tweet_time, content))
+        if len(items) >= limit:
+            break
+    return items
+
+
+def parse_jin10_flashes(html):
+    """解析金十数据首页的快讯文本（保留HTML实体，消息按HTML格式发送）"""
+    return [' '.join(HTML_TAG_RE.sub('', match).split()) for match in JIN10_FLASH_RE.findall(html)]
+
+
+def parse_jin10_items(html):
+    """解析金十数据首页的快讯，返回 [(快讯ID, 文本)]
+
+    只扫描一遍快讯正文，每条再向前查找最近的快讯容器 id="flash<数字>"（不越过上一条正文）；
+    找不到快讯ID时ID为空字符串。
+    """
+    items = []
+    last_end = 0
+    for match in JIN10_FLASH_RE.finditer(html):
+        id_pos = html.rfind('id="flash', last_end, match.start())
+        id_match = JIN10_ITEM_RE.match(html, id_pos) if id_pos >= 0 else None
+        text = ' '.join(HTML_TAG_RE.sub('', match.group(1)).split())
+        items.append((id_match.group(1) if id_match else '', text))
+        last_end = match.end()
+    return items
 
 
-async def get_eth_price():
-    """获取ETH价格"""
+def parse_eastmoney_titles(html):
+    """解析东方财富网首页的新闻标题"""
+    return EASTMONEY_TITLE_RE.findall(html)
+
+
+FX168_QUOTE_URL = "https://www.fx168news.com/quote/{code}"
+FX168_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
+}
+
+
+async def _fetch_fx168_quote(code):
+    """从fx168行情页解析单个品种"""
+    session = get_http_session()
+    url = FX168_QUOTE_URL.format(code=code)
+    
+    async with session.get(url, headers=FX168_HEADERS, timeout=15) as response:
+        if response.status == 200:
+            html = await response.text()
+            
+            # 解析JSON数据 (页面包含Next.js数据)
+            try:
+                info_data = parse_fx168_info(html)
+                if info_data:
+                    price = float(info_data.get('tradePrice', 0))
+                    prev_close = float(info_data.get('preClosePrice', 0))
+                    
+                    if price > 0 and prev_close > 0:
+                        return Quote(code, price, prev_close, source='fx168')
+            except (json.JSONDecodeError, ValueError) as e:
+                logger.error(f"解析fx168数据失败: {e}")
+    return None
+
+
+@quote_source('fx168')
+async def fetch_fx168_quotes(codes):
+    """并发获取fx168行情，返回 {代码: Quote}"""
+    codes = list(dict.fromkeys(codes))
+    results = await asyncio.gather(
+        *(_fetch_fx168_quote(code) for code in codes),
+        return_exceptions=True
+    )
+    quotes = {}
+    for code, result in zip(codes, results):
+        if isinstance(result, Quote):
+            quotes[code] = result
+        elif isinstance(result, Exception):
+            logger.error(f"获取 {code} 行情失败: {result}")
+    return quotes
+
+
+# Twitter官方API - 客户端只创建一次，用户ID和since_id缓存到文件
+TWITTER_STATE_FILE = "twitter_state.json"
+twitter_client = None
+twitter_state = {'user_ids': {}, 'since_ids': {}}
+# 多个账号在不同线程中同时获取，修改和保存缓存时需要加锁
+twitter_state_lock = threading.RLock()
+
+def load_twitter_state():
+    """从文件加载缓存的用户ID和since_id"""
+    global twitter_state
     try:
-        async with aiohttp.ClientSession() as session:
-            # 使用Yahoo Finance获取ETH价格和涨跌幅
-            url = "https://query1.finance.yahoo.com/v8/finance/chart/ETH-USD"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
+        if os.path.exists(TWITTER_STATE_FILE):
+            with open(TWITTER_STATE_FILE, 'r') as f:
+                data = json.load(f)
+            twitter_state = {
+                'user_ids': data.get('user_ids', {}),
+                'since_ids': data.get('since_ids', {}),
             }
-            
-            async with session.get(url, headers=headers, timeout=15) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data.get('chart') and data['chart'].get('result'):
-                        result = data['chart']['result'][0]
-                        meta = result.get('meta', {})
-                        price = meta.get('regularMarketPrice')
-                        prev_close = meta.get('chartPreviousClose')
-                        if price and prev_close:
-                            change_pct = ((price - prev_close) / prev_close) * 100
-                            change_symbol = "📈" if change_pct >= 0 else "📉"
-                            return f"💎 ETH: ${price:,.2f} {change_symbol}{change_pct:+.2f}%"
-                return "💎 ETH: --"
+            logger.info(f"已加载 {len(twitter_state['user_ids'])} 个Twitter用户ID缓存")
     except Exception as e:
-        logger.error(f"获取ETH价格失败: {e}")
-        return "💎 ETH: --"
-
+        logger.error(f"加载Twitter缓存失败: {e}")
 
-async def get_trump_tweets():
-    """获取指定用户的最新推文"""
-    if not config.TRUMP_TWITTER_ENABLED:
-        return []
-    
-    tweets = []
-    
-    # 优先使用官方API
-    if config.TWITTER_USE_OFFICIAL_API and TWEEPY_AVAILABLE:
+def save_twitter_state():
+    """保存用户ID和since_id到文件（先写临时文件再原子替换）"""
+    tmp_path = TWITTER_STATE_FILE + '.tmp'
+    with twitter_state_lock:
         try:
-            # 使用Twitter API V2 (免费层级可用)
-            client = tweepy.Client(
+            with open(tmp_path, 'w') as f:
+                json.dump(twitter_state, f)
+            os.replace(tmp_path, TWITTER_STATE_FILE)
+        except Exception as e:
+            logger.error(f"保存Twitter缓存失败: {e}")
+
+def update_twitter_state(section, username, value):
+    """更新某个账号的缓存（user_ids 或 since_ids）并保存，可在多个线程中同时调用"""
+    with twitter_state_lock:
+        twitter_state[section][username] = value
+        save_twitter_state()
+
+def get_twitter_client():
+    """获取Twitter API V2客户端（只创建一次）"""
+    global twitter_client
+    with twitter_state_lock:
+        if twitter_client is None:
+            twitter_client = tweepy.Client(
                 consumer_key=config.TWITTER_API_KEY,
                 consumer_secret=config.TWITTER_API_SECRET,
                 access_token=config.TWITTER_ACCESS_TOKEN,
                 access_token_secret=config.TWITTER_ACCESS_TOKEN_SECRET
             )
+    return twitter_client
+
+def _fetch_official_tweets(username):
+    """通过Twitter API V2获取新推文（同步调用，在线程中执行）
+
+    用户ID只查询一次并缓存；带上since_id后接口只返回比上次更新的推文。
+    """
+    client = get_twitter_client()
+    
+    # 获取用户ID
+    user_id = twitter_state['user_ids'].get(username)
+    if user_id is None:
+        user = client.get_user(username=username)
+        if not user.data:
+            logger.error(f"用户 @{username} 不存在")
+            return []
+        user_id = str(user.data.id)
+        update_twitter_state('user_ids', username, user_id)
+    
+    # 获取用户最新推文 (使用API V2)
+    params = {
+        'id': user_id,
+        'max_results': 5,
+        'exclude': ['retweets', 'replies'],
+        'tweet_fields': ['created_at', 'text']
+    }
+    since_id = twitter_state['since_ids'].get(username)
+    if since_id:
+        params['since_id'] = since_id
+    tweets_response = client.get_users_tweets(**params)
+    
+    tweets = []
+    for tweet in tweets_response.data or []:
+        tweets.append({
+            'id': str(tweet.id),
+            'content': tweet.text,
+            'time': tweet.created_at.strftime('%Y-%m-%d %H:%M:%S') if tweet.created_at else '',
+            'url': f"https://twitter.com/{username}/status/{tweet.id}"
+        })
+    
+    newest_id = (tweets_response.meta or {}).get('newest_id')
+    if newest_id and newest_id != since_id:
+        update_twitter_state('since_ids', username, newest_id)
+    
+    return tweets
+
+
+# 推文镜像统计 - 按最近的成功率和延迟给镜像排序
+class MirrorStats:
+    """记录每个镜像最近的成功率和响应延迟（指数移动平均）"""
+
+    def __init__(self, alpha=0.3, default_latency=5.0):
+        self.alpha = alpha
+        self.default_latency = default_latency
+        self._success = {}
+        self._latency = {}
+
+    def record(self, name, ok, latency):
+        """记录一次请求结果"""
+        success = 1.0 if ok else 0.0
+        self._success[name] = self._success.get(name, 0.5) * (1 - self.alpha) + success * self.alpha
+        if ok:
+            previous = self._latency.get(name, latency)
+            self._latency[name] = previous * (1 - self.alpha) + latency * self.alpha
+
+    def score(self, name):
+        """成功率越高、延迟越低得分越高；没有记录的镜像按中性值处理"""
+        success = self._success.get(name, 0.5)
+        latency = self._latency.get(name, self.default_latency)
+        return success / (1.0 + latency)
+
+    def rank(self, mirrors):
+        """按得分从高到低排序，得分相同时保持配置顺序"""
+        return sorted(mirrors, key=lambda mirror: -self.score(mirror['name']))
+
+
+mirror_stats = MirrorStats()
+mirror_semaphores = {}
+
+
+def _tweet_mirrors(username):
+    """第三方推文来源列表（Nitter、RSS Bridge、Syndication API）"""
+    mirrors = []
+    for instance in config.TRUMP_NITTER_INSTANCES:
+        mirrors.append({'name': instance, 'kind': 'nitter', 'url': f"{instance}/{username}"})
+    for instance in TWITTER_RSS_BRIDGE_INSTANCES:
+        mirrors.append({
+            'name': instance,
+            'kind': 'rss_bridge',
+            'url': f"{instance}?action=display&bridge=Twitter&context=By+username&u={username}&format=Json"
+        })
+    mirrors.append({
+        'name': 'syndication',
+        'kind': 'syndication',
+        'url': f"https://cdn.syndication.twimg.com/timeline/profile?screen_name={username}&count=5"
+    })
+    return mirrors
+
+
+async def _fetch_nitter_tweets(mirror, username):
+    """从Nitter实例解析推文"""
+    session = get_http_session()
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
+    }
+    tweets = []
+    
+    async with session.get(mirror['url'], headers=headers, timeout=10) as response:
+        if response.status == 200:
+            html = await response.text()
             
-            # 获取用户ID
-            user = client.get_user(username=config.TRUMP_TWITTER_USERNAME)
-            if not user.data:
-                logger.error(f"用户 @{config.TRUMP_TWITTER_USERNAME} 不存在")
-                return []
-            
-            user_id = user.data.id
-            
-            # 获取用户最新推文 (使用API V2)
-            tweets_response = client.get_users_tweets(
-                id=user_id,
-                max_results=5,
-                exclude=['retweets', 'replies'],
-                tweet_fields=['created_at', 'text']
-            )
+            for tweet_id, tweet_time, content in parse_nitter_timeline(html):
+                tweets.append({
+                    'id': tweet_id,
+                    'content': content,
+                    'time': tweet_time,
+                    'url': f"https://twitter.com/{username}/status/{tweet_id}"
+                })
+    
+    return tweets
+
+
+async def _fetch_rss_bridge_tweets(mirror, username):
+    """从RSS Bridge的JSON输出解析推文"""
+    session = get_http_session()
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
+    }
+    tweets = []
+    
+    async with session.get(mirror['url'], headers=headers, timeout=10) as response:
+        if response.status == 200:
+            data = await response.json(content_type=None)
             
-            if tweets_response.data:
-                for tweet in tweets_response.data:
-                    tweets.append({
-                        'id': str(tweet.id),
-                        'content': tweet.text,
-                        'time': tweet.created_at.strftime('%Y-%m-%d %H:%M:%S') if tweet.created_at else '',
-                        'url': f"https://twitter.com/{config.TRUMP_TWITTER_USERNAME}/status/{tweet.id}"
-                    })
+            for item in data.get('items', [])[:5]:
+                # 从URL提取推文ID，不是推文链接的条目直接跳过
+                url = item.get('url', '')
+                tweet_id = url.split('/status/')[-1].split('?')[0].split('#')[0] if '/status/' in url else ''
+                if not tweet_id.isdigit():
+                    continue
+                content = item.get('content_text', '') or item.get('title', '')
+                date = item.get('date_published', '')
                 
-                logger.info(f"从Twitter API V2获取到 {len(tweets)} 条推文")
-                return tweets
-            else:
-                logger.warning(f"用户 @{config.TRUMP_TWITTER_USERNAME} 暂无推文")
-                return []
+                # 跳过转发
+                if content.startswith('RT @'):
+                    continue
                 
-        except Exception as e:
-            logger.error(f"Twitter官方API获取失败: {e}")
-            logger.info("尝试使用备用方案...")
+                tweets.append({
+                    'id': tweet_id,
+                    'content': content,
+                    'time': date,
+                    'url': url
+                })
     
-    # 备用方案：使用第三方服务
-    try:
-        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=15)) as session:
-            # 方法1: 尝试使用 Nitter (Twitter的开源前端)
-            for nitter_instance in config.TRUMP_NITTER_INSTANCES:
-                try:
-                    url = f"{nitter_instance}/{config.TRUMP_TWITTER_USERNAME}"
-                    headers = {
-                        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
-                    }
-                    
-                    async with session.get(url, headers=headers, timeout=10) as response:
-                        if response.status == 200:
-                            html = await response.text()
-                            import re
-                            from html import unescape
-                            
-                            # 解析推文内容
-                            # Nitter的HTML结构：推文在 <div class="tweet-content"> 中
-                            tweet_pattern = r'<div class="tweet-content[^"]*"[^>]*>(.*?)</div>'
-                            tweet_matches = re.findall(tweet_pattern, html, re.DOTALL)
-                            
-                            # 解析推文ID和时间
-                            tweet_link_pattern = r'href="/[^/]+/status/(\d+)"'
-                            tweet_ids = re.findall(tweet_link_pattern, html)
-                            
-                            # 解析时间
-                            time_pattern = r'<span class="tweet-date"[^>]*title="([^"]+)"'
-                            times = re.findall(time_pattern, html)
-                            
-                            for i, (content, tweet_id) in enumerate(zip(tweet_matches[:5], tweet_ids[:5])):
-                                # 清理HTML标签
-                                clean_content = re.sub(r'<[^>]+>', '', content)
-                                clean_content = unescape(clean_content).strip()
-                                
-                                # 跳过转发和回复
-                                if clean_content.startswith('RT @') or clean_content.startswith('@'):
-                                    continue
-                                
-                                tweet_time = times[i] if i < len(times) else "未知时间"
-                                
-                                tweets.append({
-                                    'id': tweet_id,
-                                    'content': clean_content,
-                                    'time': tweet_time,
-                                    'url': f"https://twitter.com/{config.TRUMP_TWITTER_USERNAME}/status/{tweet_id}"
-                                })
-                            
-                            if tweets:
-                                logger.info(f"从 {nitter_instance} 获取到 {len(tweets)} 条推文")
-                                return tweets
-                            
-                except Exception as e:
-                    logger.warning(f"从 {nitter_instance} 获取推文失败: {e}")
-                    continue
-            
-            # 方法2: 使用 Twitter API (需要API密钥)
-            # 这里可以添加Twitter API的实现，但需要用户自己申请API密钥
+    return tweets
+
+
+async def _fetch_syndication_tweets(mirror, username):
+    """从Syndication API解析推文"""
+    session = get_http_session()
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
+        'Accept': 'application/json'
+    }
+    tweets = []
+    
+    async with session.get(mirror['url'], headers=headers, timeout=10) as response:
+        if response.status == 200:
+            # content-type不一定是json，强制按JSON解析
+            data = await response.json(content_type=None)
             
-            # 方法3: 使用 RSS Bridge (更可靠的备选方案)
-            try:
-                # 尝试使用 RSS Bridge
-                rss_instances = [
-                    f"https://rss-bridge.org/bridge01/?action=display&bridge=Twitter&context=By+username&u={config.TRUMP_TWITTER_USERNAME}&format=Json",
-                    f"https://wtf.roflcopter.fr/rss-bridge/?action=display&bridge=Twitter&context=By+username&u={config.TRUMP_TWITTER_USERNAME}&format=Json",
-                ]
+            for tweet_data in data.get('timeline', [])[:5]:
+                tweet_id = tweet_data.get('id_str', '')
+                content = tweet_data.get('text', '')
+                created_at = tweet_data.get('created_at', '')
                 
-                for rss_url in rss_instances:
-                    try:
-                        headers = {
-                            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
-                        }
-                        
-                        async with session.get(rss_url, headers=headers, timeout=10) as response:
-                            if response.status == 200:
-                                try:
-                                    data = await response.json()
-                                    
-                                    if 'items' in data:
-                                        for item in data['items'][:5]:
-                                            # 从URL提取推文ID
-                                            url = item.get('url', '')
-                                            tweet_id = url.split('/')[-1] if url else ''
-                                            content = item.get('content_text', '') or item.get('title', '')
-                                            date = item.get('date_published', '')
-                                            
-                                            # 跳过转发
-                                            if content.startswith('RT @'):
-                                                continue
-                                            
-                                            tweets.append({
-                                                'id': tweet_id,
-                                                'content': content,
-                                                'time': date,
-                                                'url': url
-                                            })
-                                        
-                                        if tweets:
-                                            logger.info(f"从 RSS Bridge 获取到 {len(tweets)} 条推文")
-                                            return tweets
-                                except Exception as e:
-                                    logger.warning(f"解析RSS数据失败: {e}")
-                                    continue
-                    except Exception as e:
-                        logger.warning(f"从 {rss_url} 获取失败: {e}")
-                        continue
-                        
-            except Exception as e:
-                logger.warning(f"RSS Bridge 方法失败: {e}")
-            
-            # 方法4: 使用 Syndication API (作为最后备选)
-            try:
-                api_url = f"https://cdn.syndication.twimg.com/timeline/profile?screen_name={config.TRUMP_TWITTER_USERNAME}&count=5"
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
-                    'Accept': 'application/json'
-                }
+                if content.startswith('RT @'):
+                    continue
                 
-                async with session.get(api_url, headers=headers, timeout=10) as response:
-                    if response.status == 200:
-                        content_type = response.headers.get('content-type', '')
-                        
-                        # 尝试解析JSON
-                        if 'json' in content_type.lower():
-                            data = await response.json()
-                        else:
-                            # 尝试强制解析为JSON
-                            text = await response.text()
-                            import json
-                            data = json.loads(text)
-                        
-                        if 'timeline' in data:
-                            for tweet_data in data['timeline'][:5]:
-                                tweet_id = tweet_data.get('id_str', '')
-                                content = tweet_data.get('text', '')
-                                created_at = tweet_data.get('created_at', '')
-                                
-                                if content.startswith('RT @'):
-                                    continue
-                                
-                                tweets.append({
-                                    'id': tweet_id,
-                                    'content': content,
-                                    'time': created_at,
-                                    'url': f"https://twitter.com/{config.TRUMP_TWITTER_USERNAME}/status/{tweet_id}"
-                                })
-                            
-                            if tweets:
-                                logger.info(f"从 Syndication API 获取到 {len(tweets)} 条推文")
-                                return tweets
-                                
-            except Exception as e:
-                logger.warning(f"从 Syndication API 获取推文失败: {e}")
-            
-            # 如果所有方法都失败
-            logger.warning("所有获取推文的方法都失败了")
-            return []
-            
+                tweets.append({
+                    'id': tweet_id,
+                    'content': content,
+                    'time': created_at,
+                    'url': f"https://twitter.com/{username}/status/{tweet_id}"
+                })
+    
+    return tweets
+
+
+TWEET_MIRROR_FETCHERS = {
+    'nitter': _fetch_nitter_tweets,
+    'rss_bridge': _fetch_rss_bridge_tweets,
+    'syndication': _fetch_syndication_tweets,
+}
+
+
+def _mirror_semaphore(name):
+    """每个镜像的并发请求限制，避免多个账号同时请求同一镜像被封"""
+    semaphore = mirror_semaphores.get(name)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(TWEET_MIRROR_CONCURRENCY)
+        mirror_semaphores[name] = semaphore
+    return semaphore
+
+
+async def _fetch_from_mirror(mirror, username):
+    """从单个镜像获取推文，并记录成功率和延迟"""
+    try:
+        async with _mirror_semaphore(mirror['name']):
+            started = time.monotonic()
+            tweets = await TWEET_MIRROR_FETCHERS[mirror['kind']](mirror, username)
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
-        logger.error(f"获取川普推文失败: {e}")
+        mirror_stats.record(mirror['name'], False, time.monotonic() - started)
+        logger.warning(f"从 {mirror['name']} 获取推文失败: {e}")
         return []
+    
+    mirror_stats.record(mirror['name'], bool(tweets), time.monotonic() - started)
+    if tweets:
+        logger.info(f"从 {mirror['name']} 获取到 {len(tweets)} 条推文")
+    return tweets
+
+
+async def _race_tweet_mirrors(mirrors, username):
+    """按排名竞速请求镜像，取第一个非空结果并取消其余请求
+
+    同时进行的请求不超过 TWEET_RACE_FANOUT 个；TWEET_HEDGE_DELAY 大于0时，
+    每隔这段时间还没有结果才追加下一个镜像，否则一次发出前 TWEET_RACE_FANOUT 个。
+    """
+    ranked = mirror_stats.rank(mirrors)
+    fanout = max(1, TWEET_RACE_FANOUT) if TWEET_RACE_ENABLED else 1
+    running = {}
+    next_index = 0
+    
+    try:
+        while next_index < len(ranked) or running:
+            while next_index < len(ranked) and len(running) < fanout:
+                mirror = ranked[next_index]
+                next_index += 1
+                running[asyncio.ensure_future(_fetch_from_mirror(mirror, username))] = mirror
+                if TWEET_HEDGE_DELAY > 0:
+                    break
+            
+            # 还能追加镜像时，最多等待一个对冲间隔
+            can_hedge = next_index < len(ranked) and len(running) < fanout
+            timeout = TWEET_HEDGE_DELAY if can_hedge and TWEET_HEDGE_DELAY > 0 else None
+            done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            
+            for task in done:
+                running.pop(task)
+                tweets = task.result()
+                if tweets:
+                    return tweets
+    finally:
+        for task in running:
+            task.cancel()
+    
+    return []
 
 
-async def check_and_send_trump_tweets():
-    """检查并发送川普的新推文"""
+async def get_trump_tweets(username=None):
+    """获取指定用户的最新推文"""
     if not config.TRUMP_TWITTER_ENABLED:
-        return
+        return []
+    username = username or config.TRUMP_TWITTER_USERNAME
+    
+    # 优先使用官方API（在线程中执行，不阻塞事件循环）
+    if config.TWITTER_USE_OFFICIAL_API and TWEEPY_AVAILABLE:
+        try:
+            tweets = await asyncio.to_thread(_fetch_official_tweets, username)
+            if tweets:
+                logger.info(f"从Twitter API V2获取到 @{username} 的 {len(tweets)} 条推文")
+            else:
+                logger.info(f"用户 @{username} 暂无新推文")
+            return tweets
+        except Exception as e:
+            logger.error(f"Twitter官方API获取 @{username} 失败: {e}")
+            logger.info("尝试使用备用方案...")
     
+    # 备用方案：使用第三方服务（Nitter、RSS Bridge、Syndication API）
+    tweets = await _race_tweet_mirrors(_tweet_mirrors(username), username)
+    if not tweets:
+        logger.warning(f"获取 @{username} 推文的所有方法都失败了")
+    return tweets
+
+
+async def send_account_tweets(account):
+    """检查单个账号并把新推文发送到该账号对应的群组及订阅了推特的群组"""
+    username = account['username']
     try:
-        logger.info("开始检查川普推特...")
-        tweets = await get_trump_tweets()
+        tweets = await get_trump_tweets(username)
         
         if not tweets:
-            logger.info("未获取到新推文")
+            logger.info(f"@{username} 未获取到新推文")
             return
         
         new_tweets_sent = 0
+        chat_ids = [account['chat_id']] + subscription_registry.chats_for('tweets')
         
         # 倒序处理推文，先发旧的
         for tweet in reversed(tweets):
             tweet_id = tweet['id']
             
             # 检查是否已发送
-            if tweet_id in sent_tweet_ids:
+            if sent_tweet_store.contains(username, tweet_id):
                 continue
             
             # 构建消息
-            username_display = config.TRUMP_TWITTER_USERNAME
             message = f"""
-🐦 <b>@{username_display} 推特更新</b>
+🐦 <b>@{username} 推特更新</b>
 
 {tweet['content']}
 
@@ -590,427 +1677,599 @@ async def check_and_send_trump_tweets():
 🕐 {tweet['time']}
             """.strip()
             
-            try:
-                # 发送消息
-                await bot.send_message(
-                    chat_id=CHAT_ID,
-                    text=message,
-                    parse_mode='HTML',
-                    disable_web_page_preview=False
-                )
-                
-                # 记录已发送
-                sent_tweet_ids.add(tweet_id)
-                save_sent_tweets()
+            # 发送到该账号配置的群组和订阅了推特的群组（限速由fanout_sender处理）
+            sent_messages = await fanout_sender.send(
+                chat_ids,
+                message,
+                parse_mode='HTML',
+                disable_web_page_preview=False
+            )
+            
+            # 即使发送失败，也标记为已处理，避免重复尝试
+            sent_tweet_store.add(username, tweet_id)
+            if sent_messages:
                 new_tweets_sent += 1
-                
-                logger.info(f"✅ 成功发送推文 @{config.TRUMP_TWITTER_USERNAME} ID: {tweet_id}")
-                
-                # 避免发送太快
-                await asyncio.sleep(2)
-                
-            except TelegramError as e:
-                logger.error(f"发送川普推文失败: {e}")
-                # 即使发送失败，也标记为已处理，避免重复尝试
-                sent_tweet_ids.add(tweet_id)
-                save_sent_tweets()
+                logger.info(f"✅ 成功发送推文 @{username} ID: {tweet_id} ({len(sent_messages)}/{len(chat_ids)} 个群组)")
+            else:
+                logger.error(f"发送 @{username} 推文失败: {tweet_id}")
         
         if new_tweets_sent > 0:
-            logger.info(f"✅ 共发送了 {new_tweets_sent} 条新推文")
+            logger.info(f"✅ @{username} 共发送了 {new_tweets_sent} 条新推文")
         else:
-            logger.info("没有新推文需要发送")
+            logger.info(f"@{username} 没有新推文需要发送")
             
     except Exception as e:
-        logger.error(f"检查川普推文时发生错误: {e}")
-
+        logger.error(f"检查 @{username} 推文时发生错误: {e}")
 
-async def get_sse_index():
-    """获取沪A大盘指数（上证指数）- 使用东方财富网API"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            # 使用东方财富网API获取上证指数
-            url = "https://push2.eastmoney.com/api/qt/stock/get"
-            params = {
-                'secid': '1.000001',  # 上证指数
-                'fields': 'f43,f44,f45,f46,f57,f58,f60,f170',
-                'ut': 'fa5fd1943c7b386f172d6893dbfba10b'
-            }
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
-                'Referer': 'https://quote.eastmoney.com/'
-            }
-            
-            async with session.get(url, params=params, headers=headers, timeout=15) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    if data.get('data'):
-                        quote = data['data']
-                        
-                        # 东方财富网价格字段说明:
-                        # f43: 最新价 (单位: 分，需要除以100)
-                        # f60: 昨收价 (单位: 分，需要除以100)
-                        # f170: 涨跌幅百分比 (单位: 百分点的100倍，需要除以100)
-                        price = quote.get('f43', 0)  # 最新价
-                        prev_close = quote.get('f60', 0)  # 昨收
-                        change_pct = quote.get('f170', 0)  # 涨跌幅
-                        
-                        if price > 0 and prev_close > 0:
-                            # 价格需要除以100转换为点数
-                            price = price / 100
-                            prev_close = prev_close / 100
-                            # 涨跌幅需要除以100转换为百分比
-                            change_pct = change_pct / 100
-                            change_value = price - prev_close
-                            
-                            # 检查市场状态
-                            current_weekday = datetime.now().weekday()
-                            current_hour = datetime.now().hour
-                            
-                            market_status = ""
-                            # 交易日：周一至周五
-                            # 交易时间：9:30-11:30, 13:00-15:00
-                            if current_weekday >= 5:  # 周末
-                                market_status = " [周五收盘]"
-                            elif current_hour < 9 or (current_hour == 9 and datetime.now().minute < 30):
-                                market_status = " [未开盘]"
-                            elif (current_hour >= 11 and current_hour < 13) or (current_hour == 11 and datetime.now().minute >= 30):
-                                market_status = " [午间休市]"
-                            elif current_hour >= 15:
-                                market_status = " [收盘]"
-                            
-                            change_symbol = "📈" if change_pct >= 0 else "📉"
-                            return f"📊 上证指数: {price:.2f}{market_status} {change_symbol}{change_value:+.2f} ({change_pct:+.2f}%)"
-                        
-                logger.warning("上证指数API返回数据格式异常")
-                return "📊 上证指数: --"
-    except asyncio.TimeoutError:
-        logger.error("获取上证指数超时")
-        return "📊 上证指数: 超时"
-    except Exception as e:
-        logger.error(f"获取上证指数失败: {e}")
-        return "📊 上证指数: --"
 
+async def check_and_send_trump_tweets():
+    """共享轮询：检查所有到期的监控账号并发送新推文
 
-async def get_nasdaq_index():
-    """获取纳斯达克指数"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            # 使用Yahoo Finance获取纳斯达克指数 (代码: ^IXIC)
-            url = "https://query1.finance.yahoo.com/v8/finance/chart/%5EIXIC"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
-            }
-            
-            async with session.get(url, headers=headers, timeout=15) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data.get('chart') and data['chart'].get('result'):
-                        result = data['chart']['result'][0]
-                        meta = result.get('meta', {})
-                        price = meta.get('regularMarketPrice')
-                        prev_close = meta.get('chartPreviousClose')
-                        
-                        if price and prev_close:
-                            change_pct = ((price - prev_close) / prev_close) * 100
-                            change_value = price - prev_close
-                            
-                            # 检查市场状态
-                            market_state = meta.get('marketState', 'CLOSED')
-                            current_weekday = datetime.now().weekday()
-                            
-                            market_status = ""
-                            if current_weekday >= 5:  # 周末
-                                market_status = " [周五收盘]"
-                            elif market_state == 'CLOSED':
-                                market_status = " [收盘]"
-                            
-                            change_symbol = "📈" if change_pct >= 0 else "📉"
-                            return f"📊 纳斯达克: {price:,.2f}{market_status} {change_symbol}{change_value:+.2f} ({change_pct:+.2f}%)"
-                        
-                logger.warning("纳斯达克指数API返回数据格式异常")
-                return "📊 纳斯达克: --"
-    except asyncio.TimeoutError:
-        logger.error("获取纳斯达克指数超时")
-        return "📊 纳斯达克: 超时"
-    except Exception as e:
-        logger.error(f"获取纳斯达克指数失败: {e}")
-        return "📊 纳斯达克: --"
+    由一个定时任务驱动，每次只处理到了各自检查间隔的账号，
+    各账号并发获取，对同一镜像的并发请求由镜像信号量限制。
+    """
+    if not config.TRUMP_TWITTER_ENABLED:
+        return
+    
+    now = time.monotonic()
+    due_accounts = [
+        account for account in TWITTER_ACCOUNTS
+        if twitter_next_check.get(account['username'], 0) <= now
+    ]
+    if not due_accounts:
+        return
+    
+    logger.info(f"开始检查推特: {', '.join('@' + account['username'] for account in due_accounts)}")
+    for account in due_accounts:
+        # 留出几秒余量，避免定时任务的微小抖动让账号错过一轮
+        twitter_next_check[account['username']] = now + account['interval'] * 60 - 5
+    
+    await asyncio.gather(*(send_account_tweets(account) for account in due_accounts))
+
+
+# 品种配置中可用的calendar（市场状态标注方式），含义见 market_status
+MARKET_CALENDARS = ('24h', 'spot', 'index', 'sge', 'a_share')
+
+
+def load_instruments(entries):
+    """校验品种配置并补全默认值，返回 {品种: 配置}（保持配置顺序）
+
+    数据源未注册、缺少必填项或品种名重复的配置会被跳过并记录日志，不影响其他品种。
+    """
+    instruments = {}
+    for entry in entries:
+        key = entry.get('key', '')
+        if not re.fullmatch(r'[a-z0-9_]{1,32}', key) or key in instruments:
+            logger.error(f"品种配置无效或重复，已跳过: {entry}")
+            continue
+        if entry.get('source') not in QUOTE_SOURCES or not entry.get('symbol'):
+            logger.error(f"品种 {key} 的数据源未注册或缺少代码，已跳过")
+            continue
+        calendar = entry.get('calendar', '24h')
+        if calendar not in MARKET_CALENDARS:
+            logger.error(f"品种 {key} 的calendar无效: {calendar}，已跳过")
+            continue
+        name = entry.get('name', key.upper())
+        price_format = entry.get('format') or "{}{{:,.{}f}}{}".format(
+            entry.get('prefix', ''), entry.get('decimals', 2), entry.get('suffix', '')
+        )
+        instruments[key] = {
+            **entry,
+            'name': name,
+            'label': entry.get('label', name),
+            'format': price_format,
+            'calendar': calendar,
+            'aliases': entry.get('aliases') or [name],
+        }
+    return instruments
+
+
+INSTRUMENTS = load_instruments(getattr(config, 'INSTRUMENTS', DEFAULT_INSTRUMENTS))
+
+# 品种 -> (数据源, 代码)，用于读取缓存及由行情反查品种
+INSTRUMENT_SOURCES = {key: (item['source'], item['symbol']) for key, item in INSTRUMENTS.items()}
+
+def group_by_source(instrument_sources):
+    """按数据源分组品种代码: 数据源 -> (代码列表, 批量获取函数)"""
+    groups = {}
+    for source, symbol in instrument_sources.values():
+        groups.setdefault(source, ([], QUOTE_SOURCES[source]))[0].append(symbol)
+    return groups
+
+
+# 价格推送使用的数据源: 数据源 -> (品种代码列表, 批量获取函数)
+# 按数据源自动分组，品种再多每个数据源每轮也只调用一次批量获取函数
+PRICE_SOURCES = group_by_source(INSTRUMENT_SOURCES)
+
+
+def market_status(instrument, quote, now):
+    """价格后面的市场状态标注，不需要标注时返回空字符串
+
+    calendar: 24h=不标注, spot=只标注周末, index=周末及收盘,
+    sge=上金所闭市, a_share=按A股交易时段（9:30-11:30, 13:00-15:00）
+    """
+    calendar = instrument['calendar']
+    if calendar == '24h':
+        return ""
+    if calendar == 'sge':
+        if quote.market_state != 'CLOSED':
+            return ""
+        return " [周五收盘]" if now.weekday() >= 5 else " [闭市]"
+    if now.weekday() >= 5:  # 周末
+        return " [周五收盘]"
+    if calendar == 'index':
+        return " [收盘]" if quote.market_state == 'CLOSED' else ""
+    if calendar == 'a_share':
+        if now.hour < 9 or (now.hour == 9 and now.minute < 30):
+            return " [未开盘]"
+        if (now.hour >= 11 and now.hour < 13) or (now.hour == 11 and now.minute >= 30):
+            return " [午间休市]"
+        if now.hour >= 15:
+            return " [收盘]"
+    return ""
+
+
+def render_quote(key, quote, now=None):
+    """把行情渲染为价格消息中的一行（所有数据源共用）"""
+    instrument = INSTRUMENTS[key]
+    label = instrument['label']
+    if quote is None:
+        return f"{label}: --"
+    
+    now = now or datetime.now()
+    price_text = instrument['format'].format(quote.price)
+    status = market_status(instrument, quote, now)
+    stale = stale_suffix(quote)
+    
+    if instrument['calendar'] == 'sge' and quote.market_state == 'CLOSED':
+        # 闭市时显示昨收价，不显示涨跌
+        return f"{label}: {price_text}{status}{stale}"
+    
+    change_symbol = "📈" if quote.change_pct >= 0 else "📉"
+    if instrument['calendar'] in ('index', 'a_share'):
+        return f"{label}: {price_text}{status} {change_symbol}{quote.change:+.2f} ({quote.change_pct:+.2f}%){stale}"
+    return f"{label}: {price_text}{status} {change_symbol}{quote.change_pct:+.2f}%{stale}"
+
+
+def build_price_message(source_quotes, current_time):
+    """根据各数据源的行情构建价格消息，品种按 INSTRUMENTS 的顺序排列"""
+    now = datetime.now()
+    lines = "\n".join(
+        render_quote(key, source_quotes.get(source, {}).get(symbol), now)
+        for key, (source, symbol) in INSTRUMENT_SOURCES.items()
+    )
+    
+    return f"""
+📊 <b>金融市场价格更新</b>
 
+{lines}
 
-async def get_dow_jones_index():
-    """获取道琼斯指数"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            # 使用Yahoo Finance获取道琼斯指数 (代码: ^DJI)
-            url = "https://query1.finance.yahoo.com/v8/finance/chart/%5EDJI"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
-            }
-            
-            async with session.get(url, headers=headers, timeout=15) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data.get('chart') and data['chart'].get('result'):
-                        result = data['chart']['result'][0]
-                        meta = result.get('meta', {})
-                        price = meta.get('regularMarketPrice')
-                        prev_close = meta.get('chartPreviousClose')
-                        
-                        if price and prev_close:
-                            change_pct = ((price - prev_close) / prev_close) * 100
-                            change_value = price - prev_close
-                            
-                            # 检查市场状态
-                            market_state = meta.get('marketState', 'CLOSED')
-                            current_weekday = datetime.now().weekday()
-                            
-                            market_status = ""
-                            if current_weekday >= 5:  # 周末
-                                market_status = " [周五收盘]"
-                            elif market_state == 'CLOSED':
-                                market_status = " [收盘]"
-                            
-                            change_symbol = "📈" if change_pct >= 0 else "📉"
-                            return f"📊 道琼斯: {price:,.2f}{market_status} {change_symbol}{change_value:+.2f} ({change_pct:+.2f}%)"
-                        
-                logger.warning("道琼斯指数API返回数据格式异常")
-                return "📊 道琼斯: --"
-    except asyncio.TimeoutError:
-        logger.error("获取道琼斯指数超时")
-        return "📊 道琼斯: 超时"
-    except Exception as e:
-        logger.error(f"获取道琼斯指数失败: {e}")
-        return "📊 道琼斯: --"
+🕐 更新时间: {current_time}
+    """.strip()
 
 
-async def get_hsi_index():
-    """获取香港恒生指数"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            # 使用Yahoo Finance获取恒生指数 (代码: ^HSI)
-            url = "https://query1.finance.yahoo.com/v8/finance/chart/%5EHSI"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
+def _collect_source_quotes(source_tasks, source_symbols):
+    """汇总各数据源的结果，未完成的数据源使用缓存中已有的值"""
+    source_quotes = {}
+    for source, task in source_tasks.items():
+        if task.done() and not task.cancelled() and task.exception() is None:
+            source_quotes[source] = task.result()
+        else:
+            source_quotes[source] = {
+                symbol: quote
+                for symbol in source_symbols[source]
+                for quote in [quote_cache.get(source, symbol)]
+                if quote is not None
             }
-            
-            async with session.get(url, headers=headers, timeout=15) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data.get('chart') and data['chart'].get('result'):
-                        result = data['chart']['result'][0]
-                        meta = result.get('meta', {})
-                        price = meta.get('regularMarketPrice')
-                        prev_close = meta.get('chartPreviousClose')
-                        
-                        if price and prev_close:
-                            change_pct = ((price - prev_close) / prev_close) * 100
-                            change_value = price - prev_close
-                            
-                            # 检查市场状态
-                            market_state = meta.get('marketState', 'CLOSED')
-                            current_weekday = datetime.now().weekday()
-                            
-                            market_status = ""
-                            if current_weekday >= 5:  # 周末
-                                market_status = " [周五收盘]"
-                            elif market_state == 'CLOSED':
-                                market_status = " [收盘]"
-                            
-                            change_symbol = "📈" if change_pct >= 0 else "📉"
-                            return f"📊 恒生指数: {price:,.2f}{market_status} {change_symbol}{change_value:+.2f} ({change_pct:+.2f}%)"
-                        
-                logger.warning("恒生指数API返回数据格式异常")
-                return "📊 恒生指数: --"
-    except asyncio.TimeoutError:
-        logger.error("获取恒生指数超时")
-        return "📊 恒生指数: 超时"
-    except Exception as e:
-        logger.error(f"获取恒生指数失败: {e}")
-        return "📊 恒生指数: --"
+    return source_quotes
 
 
-async def get_hstech_index():
-    """获取恒生科技指数"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            # 使用Yahoo Finance获取恒生科技指数 (代码: HSTECH.HK)
-            url = "https://query1.finance.yahoo.com/v8/finance/chart/HSTECH.HK"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
-            }
-            
-            async with session.get(url, headers=headers, timeout=15) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data.get('chart') and data['chart'].get('result'):
-                        result = data['chart']['result'][0]
-                        meta = result.get('meta', {})
-                        price = meta.get('regularMarketPrice')
-                        prev_close = meta.get('chartPreviousClose')
-                        
-                        if price and prev_close:
-                            change_pct = ((price - prev_close) / prev_close) * 100
-                            change_value = price - prev_close
-                            
-                            # 检查市场状态
-                            market_state = meta.get('marketState', 'CLOSED')
-                            current_weekday = datetime.now().weekday()
-                            
-                            market_status = ""
-                            if current_weekday >= 5:  # 周末
-                                market_status = " [周五收盘]"
-                            elif market_state == 'CLOSED':
-                                market_status = " [收盘]"
-                            
-                            change_symbol = "📈" if change_pct >= 0 else "📉"
-                            return f"🔬 恒生科技: {price:,.2f}{market_status} {change_symbol}{change_value:+.2f} ({change_pct:+.2f}%)"
-                        
-                logger.warning("恒生科技指数API返回数据格式异常")
-                return "🔬 恒生科技: --"
-    except asyncio.TimeoutError:
-        logger.error("获取恒生科技指数超时")
-        return "🔬 恒生科技: 超时"
-    except Exception as e:
-        logger.error(f"获取恒生科技指数失败: {e}")
-        return "🔬 恒生科技: --"
+async def _edit_late_prices(sent_messages, sent_text, source_tasks, source_symbols, pending, current_time):
+    """等待超过截止时间的数据源，返回后把新数据编辑进各群组已发送的消息"""
+    _, still_pending = await asyncio.wait(pending, timeout=PRICE_PUSH_LATE_WINDOW)
+    if still_pending:
+        late_sources = [source for source, task in source_tasks.items() if task in still_pending]
+        logger.warning(f"数据源在{PRICE_PUSH_LATE_WINDOW}秒补发窗口内仍未返回: {', '.join(late_sources)}")
+    
+    message = build_price_message(_collect_source_quotes(source_tasks, source_symbols), current_time)
+    if message == sent_text:
+        return
+    await fanout_sender.edit(sent_messages, message, parse_mode='HTML')
+    logger.info(f"已补充迟到的行情: {current_time}")
 
 
 async def send_price_update():
-    """发送价格更新消息"""
+    """发送价格更新消息
+
+    各数据源并发获取，最多等待 PRICE_PUSH_DEADLINE 秒；
+    超时的数据源先用缓存或"--"占位，返回后再编辑进已发送的消息。
+    """
     try:
-        # 获取所有价格信息
-        gold, shanghai_gold, dollar, usdcny, oil, btc, eth, sse, nasdaq, dow, hsi, hstech = await asyncio.gather(
-            get_gold_price(),
-            get_shanghai_gold_price(),
-            get_dollar_index(),
-            get_usdcny_rate(),
-            get_oil_price(),
-            get_btc_price(),
-            get_eth_price(),
-            get_sse_index(),
-            get_nasdaq_index(),
-            get_dow_jones_index(),
-            get_hsi_index(),
-            get_hstech_index()
-        )
+        # 获取所有价格信息 - 各数据源合并为一次批量请求，优先使用缓存
+        source_symbols = {source: symbols for source, (symbols, _) in PRICE_SOURCES.items()}
+        source_tasks = {
+            source: asyncio.ensure_future(quote_cache.fetch(source, symbols, loader))
+            for source, (symbols, loader) in PRICE_SOURCES.items()
+        }
+        _, pending = await asyncio.wait(source_tasks.values(), timeout=PRICE_PUSH_DEADLINE)
+        
+        # 记录未在截止时间内返回的数据源
+        missed_sources = [source for source, task in source_tasks.items() if task in pending]
+        for source in missed_sources:
+            price_deadline_misses[source] = price_deadline_misses.get(source, 0) + 1
+        if missed_sources:
+            logger.warning(f"数据源未在{PRICE_PUSH_DEADLINE}秒内返回: {', '.join(missed_sources)} (累计: {price_deadline_misses})")
         
         # 构建消息
         current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        message = f"""
-📊 <b>金融市场价格更新</b>
-
-{sse}
-{btc}
-{eth}
-{gold}
-{shanghai_gold}
-{dollar}
-{usdcny}
-{oil}
-{nasdaq}
-{dow}
-{hsi}
-{hstech}
-
-🕐 更新时间: {current_time}
-        """.strip()
+        message = build_price_message(_collect_source_quotes(source_tasks, source_symbols), current_time)
         
-        # 发送消息
-        await bot.send_message(
-            chat_id=CHAT_ID,
-            text=message,
-            parse_mode='HTML'
-        )
-        logger.info(f"消息发送成功: {current_time}")
+        # 发送到所有订阅的群组
+        chat_ids = subscription_registry.chats_for('price', datetime.now().hour)
+        sent_messages = await fanout_sender.send(chat_ids, message, parse_mode='HTML')
+        logger.info(f"消息发送成功: {current_time} ({len(sent_messages)}/{len(chat_ids)} 个群组)")
+        
+        if pending and PRICE_PUSH_EDIT_LATE and sent_messages:
+            create_background_task(
+                _edit_late_prices(sent_messages, message, source_tasks, source_symbols, pending, current_time)
+            )
         
     except TelegramError as e:
         logger.error(f"发送消息失败: {e}")
     except Exception as e:
-        logger.error(f"发生错误: {e}")
+        logger.error(f"发生错误: {e}")
+
+
+async def run_quote_board_refresher(source, interval, snapshot_path=None):
+    """按数据源的节奏持续刷新行情缓存，/price 等命令直接读取缓存
+
+    指定snapshot_path时每次刷新后写入快照，供worker进程读取。
+    """
+    symbols, loader = PRICE_SOURCES[source]
+    while True:
+        try:
+            await quote_cache.refresh(source, symbols, loader)
+            if snapshot_path:
+                quote_cache.save_snapshot(snapshot_path)
+        except Exception as e:
+            logger.error(f"刷新 {source} 行情看板失败: {e}")
+        await asyncio.sleep(interval)
+
+
+def start_quote_board(snapshot_path=None):
+    """为每个数据源启动一个后台刷新任务"""
+    for source in PRICE_SOURCES:
+        interval = QUOTE_BOARD_INTERVALS.get(source, QUOTE_CACHE_DEFAULT_TTL)
+        create_background_task(run_quote_board_refresher(source, interval, snapshot_path))
+        logger.info(f"行情看板已启动: {source} 每{interval}秒刷新")
+
+
+# 新闻关键词匹配
+class KeywordMatcher:
+    """Aho-Corasick多关键词匹配器
+
+    关键词集合只在创建时构建一次自动机，之后每条文本只需扫描一遍，
+    耗时与关键词数量无关。区分大小写。
+    """
+
+    def __init__(self, keywords):
+        self.keywords = list(dict.fromkeys(keyword for keyword in keywords if keyword))
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+        
+        # 构建字典树
+        for keyword in self.keywords:
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                state = next_state
+            self._output[state] = self._output[state] + (keyword,)
+        
+        # 按层构建失败指针，并合并后缀状态的输出
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def _scan(self, text):
+        """逐字符扫描，依次产出命中的关键词"""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                yield from output[state]
+
+    def search(self, text):
+        """文本中是否包含任一关键词（命中即返回）"""
+        for _ in self._scan(text):
+            return True
+        return False
+
+    def find_all(self, text):
+        """返回文本中出现的所有关键词（按首次出现顺序去重）"""
+        return list(dict.fromkeys(self._scan(text)))
+
+
+news_keyword_matcher = KeywordMatcher(NEWS_KEYWORDS)
+eastmoney_keyword_matcher = KeywordMatcher(EASTMONEY_NEWS_KEYWORDS)
+
+
+# 新闻近似去重
+class NearDuplicateIndex:
+    """近似重复新闻检测：字符n-gram分片 + MinHash签名 + LSH分桶
+
+    每条新闻只和落在同一LSH桶里的候选比较（再用分片的Jaccard相似度确认），
+    查询开销不随历史条数线性增长。超出容量时淘汰最早加入的新闻。
+    金十快讯措辞固定，"现货黄金/白银上涨2%"、"美元指数涨/跌0.5%" 这类字面相似的不同新闻
+    还要求命中的关键词相同、数字一方包含另一方（允许多出日期等前缀）才算重复。
+    """
+
+    _PRIME = (1 << 61) - 1
+
+    def __init__(self, capacity, threshold=NEWS_DEDUP_THRESHOLD, ngram=2, bands=20, rows=3, seed=1):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ngram = ngram
+        self.bands = bands
+        self.rows = rows
+        rng = random.Random(seed)
+        self._perms = [
+            (rng.randrange(1, self._PRIME), rng.randrange(0, self._PRIME))
+            for _ in range(bands * rows)
+        ]
+        self._entries = OrderedDict()  # key -> (分片集合, 分桶列表, 所属簇, 关键词, 数字)
+        self._buckets = {}
+
+    def _shingles(self, text):
+        """去掉空白和标点后切成字符n-gram"""
+        text = NEWS_NORMALIZE_RE.sub('', text.lower())
+        if len(text) <= self.ngram:
+            return {text}
+        return {text[i:i + self.ngram] for i in range(len(text) - self.ngram + 1)}
+
+    @staticmethod
+    def _facts(text):
+        """命中的关键词（品种、涨跌等）和出现的数字"""
+        numbers = frozenset(float(number) for number in NEWS_NUMBER_RE.findall(text))
+        return frozenset(news_keyword_matcher.find_all(text)), numbers
+
+    def _band_keys(self, shingles):
+        """计算MinHash签名并按band切分为LSH分桶键"""
+        hashes = [zlib.crc32(shingle.encode('utf-8')) for shingle in shingles]
+        prime = self._PRIME
+        signature = [min((a * h + b) % prime for h in hashes) for a, b in self._perms]
+        return [
+            (band, tuple(signature[band * self.rows:(band + 1) * self.rows]))
+            for band in range(self.bands)
+        ]
+
+    def add(self, key, text):
+        """加入一条新闻，返回它所属簇的代表key（不是近似重复时就是它自己）"""
+        if key in self._entries:
+            return self._entries[key][2]
+        
+        shingles = self._shingles(text)
+        band_keys = self._band_keys(shingles)
+        tags, numbers = self._facts(text)
+        
+        cluster = key
+        candidates = set()
+        for band_key in band_keys:
+            candidates.update(self._buckets.get(band_key, ()))
+        for candidate in candidates:
+            candidate_shingles, _, candidate_cluster, candidate_tags, candidate_numbers = self._entries[candidate]
+            if tags != candidate_tags or not (numbers <= candidate_numbers or candidate_numbers <= numbers):
+                continue
+            union = len(shingles | candidate_shingles)
+            if union and len(shingles & candidate_shingles) / union >= self.threshold:
+                cluster = candidate_cluster
+                break
+        
+        self._entries[key] = (shingles, band_keys, cluster, tags, numbers)
+        for band_key in band_keys:
+            self._buckets.setdefault(band_key, set()).add(key)
+        
+        while len(self._entries) > self.capacity:
+            old_key, (_, old_band_keys, *_) = self._entries.popitem(last=False)
+            for band_key in old_band_keys:
+                bucket = self._buckets.get(band_key)
+                if bucket is not None:
+                    bucket.discard(old_key)
+                    if not bucket:
+                        del self._buckets[band_key]
+        
+        return cluster
+
+
+def collapse_near_duplicates(texts):
+    """合并近似重复的新闻，每个簇只保留最先出现的一条"""
+    index = NearDuplicateIndex(capacity=len(texts) or 1)
+    result = []
+    for i, text in enumerate(texts):
+        if index.add(i, text) == i:
+            result.append(text)
+    return result
+
+
+# 金十快讯增量抓取 - 后台定时拉取，新快讯放入内存环形缓冲区
+class NewsIngester:
+    """金十快讯增量抓取器
+
+    记录已处理快讯的最大ID（高水位），每次只处理比它更新的快讯；
+    请求带上ETag/Last-Modified，页面未变化时服务器返回304，不再解析。
+    """
+
+    def __init__(self, url, buffer_size):
+        self.url = url
+        self.buffer = deque(maxlen=buffer_size)
+        self.dedup = NearDuplicateIndex(capacity=buffer_size)
+        self.high_water = 0
+        self.etag = None
+        self.last_modified = None
+
+    async def poll(self):
+        """拉取一次首页，返回新增的快讯数量"""
+        session = get_http_session()
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+        }
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        
+        async with session.get(self.url, headers=headers, timeout=15) as response:
+            if response.status == 304:
+                return 0
+            if response.status != 200:
+                logger.warning(f"拉取金十快讯失败: HTTP {response.status}")
+                return 0
+            self.etag = response.headers.get('ETag')
+            self.last_modified = response.headers.get('Last-Modified')
+            html = await response.text()
+        
+        return self.ingest(parse_jin10_items(html))
+
+    def ingest(self, items):
+        """处理解析出的 (快讯ID, 文本) 列表，只保留高水位之后的相关快讯"""
+        seen_texts = {item['text'] for item in self.buffer}
+        new_items = []
+        high_water = self.high_water
+        
+        for flash_id, text in items:
+            if flash_id:
+                if int(flash_id) <= self.high_water:
+                    continue
+                high_water = max(high_water, int(flash_id))
+            elif text in seen_texts:
+                # 页面没有快讯ID时按文本去重
+                continue
+            
+            # 过滤VIP快讯
+            if 'VIP' in text or '解锁' in text:
+                continue
+            
+            # 只保留包含关键词的快讯，并记录命中的关键词
+            tags = news_keyword_matcher.find_all(text)
+            if tags:
+                new_items.append({'id': flash_id, 'text': text, 'tags': tags, 'time': time.time()})
+                seen_texts.add(text)
+        
+        # 页面按时间倒序排列，按时间正序放入缓冲区，同时归入近似重复簇
+        for item in reversed(new_items):
+            item['cluster'] = self.dedup.add(item['id'] or item['text'], item['text'])
+            self.buffer.append(item)
+        self.high_water = high_water
+        return len(new_items)
+
+    def latest(self, limit):
+        """最新的若干条快讯（新的在前）"""
+        return list(reversed(self.buffer))[:limit]
+
+    def latest_distinct(self, limit):
+        """最新的若干条快讯，近似重复的每簇只取最新一条"""
+        items = []
+        clusters = set()
+        for item in reversed(self.buffer):
+            if item['cluster'] in clusters:
+                continue
+            clusters.add(item['cluster'])
+            items.append(item)
+            if len(items) >= limit:
+                break
+        return items
+
+
+news_ingester = NewsIngester("https://www.jin10.com/", NEWS_BUFFER_SIZE)
+
+
+async def poll_financial_news():
+    """定时任务：增量拉取金十快讯"""
+    try:
+        count = await news_ingester.poll()
+        if count:
+            logger.info(f"新增 {count} 条金十快讯，缓冲区共 {len(news_ingester.buffer)} 条")
+    except Exception as e:
+        logger.error(f"增量拉取金十快讯失败: {e}")
 
 
 async def get_financial_news():
     """从金十数据获取财经快讯"""
     try:
-        async with aiohttp.ClientSession() as session:
-            # 直接解析金十数据网页HTML
-            url = "https://www.jin10.com/"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-            }
-            
-            try:
-                async with session.get(url, headers=headers, timeout=15) as response:
-                    if response.status == 200:
-                        html = await response.text()
-                        import re
-                        
-                        # 提取flash-text中的新闻内容
-                        flash_pattern = r'class="flash-text">([^<]+(?:<[^>]+>[^<]+)*)</div>'
-                        matches = re.findall(flash_pattern, html)
-                        
-                        # 过滤关键词
-                        keywords = ['金价', '黄金', '美元', '原油', 'WTI', '布伦特', '比特币', 'BTC', 
-                                   '以太坊', 'ETH', '上证', '纳斯达克', '道琼斯', '恒生', '股市', 
-                                   '加密货币', '外汇', '人民币', 'CNY', '美联储', 'Fed', '央行',
-                                   '通胀', 'CPI', 'GDP', '利率', '美债', '大盘', '指数', 
-                                   '涨', '跌', '市场', '金银']
-                        
-                        news_list = []
-                        for match in matches:
-                            # 去除HTML标签
-                            clean_text = re.sub(r'<[^>]+>', '', match)
-                            # 去除多余空格
-                            clean_text = ' '.join(clean_text.split())
-                            
-                            # 过滤VIP快讯
-                            if 'VIP' in clean_text or '解锁' in clean_text:
-                                continue
-                            
-                            # 检查是否包含关键词
-                            if any(keyword in clean_text for keyword in keywords):
-                                news_list.append(clean_text)
-                        
-                        if len(news_list) >= 5:
-                            logger.info(f"从金十数据网页成功获取 {len(news_list)} 条新闻")
-                            return news_list[:15]
-            except Exception as e:
-                logger.error(f"解析金十数据网页失败: {e}")
-            
-            # 备用方案: 从东方财富网获取并过滤
-            url2 = "https://finance.eastmoney.com/"
-            headers2 = {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
-            }
-            
-            async with session.get(url2, headers=headers2, timeout=10) as response:
+        session = get_http_session()
+        # 直接解析金十数据网页HTML
+        url = "https://www.jin10.com/"
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+        }
+        
+        try:
+            async with session.get(url, headers=headers, timeout=15) as response:
                 if response.status == 200:
                     html = await response.text()
-                    import re
                     
-                    # 提取新闻标题
-                    pattern = r'<a[^>]+title="([^"]+)"[^>]*>(?:[^<]+)</a>'
-                    matches = re.findall(pattern, html)
+                    # 提取flash-text中的新闻内容
+                    flashes = parse_jin10_flashes(html)
                     
-                    if matches:
-                        # 过滤与市场相关的新闻
-                        keywords = ['黄金', '美元', '原油', '比特币', '以太坊', '上证', '纳指', 
-                                   '道指', '恒生', '股市', '外汇', '人民币', '美联储', '央行',
-                                   '通胀', 'CPI', 'GDP', '利率', '债券', '加密', '币', '金价']
+                    news_list = []
+                    for clean_text in flashes:
+                        # 过滤VIP快讯
+                        if 'VIP' in clean_text or '解锁' in clean_text:
+                            continue
                         
-                        filtered_news = []
-                        for news in matches:
-                            if any(keyword in news for keyword in keywords):
-                                filtered_news.append(news)
-                        
-                        if len(filtered_news) >= 5:
-                            return filtered_news[:12]
-                        else:
-                            return matches[:10]
-            
-            return []
+                        # 检查是否包含关键词
+                        if news_keyword_matcher.search(clean_text):
+                            news_list.append(clean_text)
+                    
+                    if len(news_list) >= 5:
+                        logger.info(f"从金十数据网页成功获取 {len(news_list)} 条新闻")
+                        return news_list[:15]
+        except Exception as e:
+            logger.error(f"解析金十数据网页失败: {e}")
+        
+        # 备用方案: 从东方财富网获取并过滤
+        url2 = "https://finance.eastmoney.com/"
+        headers2 = {
+            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
+        }
+        
+        async with session.get(url2, headers=headers2, timeout=10) as response:
+            if response.status == 200:
+                html = await response.text()
+                
+                # 提取新闻标题
+                matches = parse_eastmoney_titles(html)
+                
+                if matches:
+                    # 过滤与市场相关的新闻
+                    filtered_news = [news for news in matches if eastmoney_keyword_matcher.search(news)]
+                    
+                    if len(filtered_news) >= 5:
+                        return filtered_news[:12]
+                    else:
+                        return matches[:10]
+        
+        return []
     except Exception as e:
         logger.error(f"获取财经新闻失败: {e}")
         return []
@@ -1019,15 +2278,17 @@ async def get_financial_news():
 async def generate_news_brief():
     """生成财经新闻简报并发送"""
     try:
-        # 获取新闻
-        news_list = await get_financial_news()
+        # 获取新闻 - 优先读取增量抓取的缓冲区，缓冲区为空时才临时抓取
+        news_list = [item['text'] for item in news_ingester.latest_distinct(15)] if NEWS_INGEST_ENABLED else []
+        if not news_list:
+            news_list = await get_financial_news()
         
         if not news_list:
             logger.warning("未能获取到财经新闻")
             return
         
-        # 去重
-        news_list = list(dict.fromkeys(news_list))
+        # 去重（包括措辞略有不同的近似重复）
+        news_list = collapse_near_duplicates(news_list)
         
         # 构建简报内容
         if config.AI_ENABLED and len(news_list) >= 3:
@@ -1042,7 +2303,8 @@ async def generate_news_brief():
 要求：1行话简洁 2客观中立 3突出市场动态"""
             
             try:
-                response = await asyncio.to_thread(
+                response = await ai_worker_pool.run(
+                    AIWorkerPool.SYSTEM,
                     gemini_model.generate_content,
                     prompt,
                     generation_config=genai.types.GenerationConfig(
@@ -1083,13 +2345,10 @@ async def generate_news_brief():
 🕐 {current_time}
         """.strip()
         
-        # 发送消息
-        await bot.send_message(
-            chat_id=CHAT_ID,
-            text=message,
-            parse_mode='HTML'
-        )
-        logger.info(f"财经简报发送成功: {current_time}")
+        # 发送到所有订阅的群组
+        chat_ids = subscription_registry.chats_for('news', datetime.now().hour)
+        sent_messages = await fanout_sender.send(chat_ids, message, parse_mode='HTML')
+        logger.info(f"财经简报发送成功: {current_time} ({len(sent_messages)}/{len(chat_ids)} 个群组)")
         
     except TelegramError as e:
         logger.error(f"发送财经简报失败: {e}")
@@ -1132,67 +2391,65 @@ async def get_financial_calendar():
         # 获取今天是星期几
         today_weekday = datetime.now().weekday()
         
-        # 尝试从多个数据源获取实时数据
-        async with aiohttp.ClientSession() as session:
-            # 简化方案：使用模拟数据配合每周固定事件
-            events = []
-            
-            # 添加今日固定事件
-            fixed_events = weekday_events.get(today_weekday, [])
-            for event in fixed_events:
-                if event not in ["无固定重要事件", "休市日"]:
-                    events.append({
-                        'time': event.split()[1] if len(event.split()) > 1 else '待定',
-                        'info': event,
-                        'importance': 3 if '⭐⭐⭐' in event else 2
-                    })
-            
-            # 添加常规性重要事件提醒
-            current_day = datetime.now().day
-            
-            # 每月初（1-5号）提醒重要数据发布日
-            if 1 <= current_day <= 5:
-                events.append({
-                    'time': '本周',
-                    'info': '⭐⭐⭐ 本周关注：美国非农就业、中国CPI/PPI数据发布',
-                    'importance': 3
-                })
-            
-            # 美联储决议周（通常每月中下旬）
-            if 15 <= current_day <= 20:
-                events.append({
-                    'time': '本月',
-                    'info': '⭐⭐⭐ 本月关注：美联储利率决议（FOMC会议）',
-                    'importance': 3
-                })
-            
-            # 如果是周五，特别提醒非农
-            if today_weekday == 4 and 1 <= current_day <= 7:
+        # 简化方案：使用模拟数据配合每周固定事件
+        events = []
+        
+        # 添加今日固定事件
+        fixed_events = weekday_events.get(today_weekday, [])
+        for event in fixed_events:
+            if event not in ["无固定重要事件", "休市日"]:
                 events.append({
-                    'time': '20:30',
-                    'info': '⭐⭐⭐ 20:30 🇺🇸 美国非农就业数据 (本月首个周五)',
-                    'importance': 3
+                    'time': event.split()[1] if len(event.split()) > 1 else '待定',
+                    'info': event,
+                    'importance': 3 if '⭐⭐⭐' in event else 2
                 })
-            
-            if events:
-                logger.info(f"生成财经日历提醒 {len(events)} 条")
-                return events
-            
-            # 如果是周末，返回休市提示
-            if today_weekday >= 5:
-                return [{
-                    'time': '全天',
-                    'info': '📅 今日市场休市',
-                    'importance': 1
-                }]
-            
-            # 默认返回一些通用提醒
+        
+        # 添加常规性重要事件提醒
+        current_day = datetime.now().day
+        
+        # 每月初（1-5号）提醒重要数据发布日
+        if 1 <= current_day <= 5:
+            events.append({
+                'time': '本周',
+                'info': '⭐⭐⭐ 本周关注：美国非农就业、中国CPI/PPI数据发布',
+                'importance': 3
+            })
+        
+        # 美联储决议周（通常每月中下旬）
+        if 15 <= current_day <= 20:
+            events.append({
+                'time': '本月',
+                'info': '⭐⭐⭐ 本月关注：美联储利率决议（FOMC会议）',
+                'importance': 3
+            })
+        
+        # 如果是周五，特别提醒非农
+        if today_weekday == 4 and 1 <= current_day <= 7:
+            events.append({
+                'time': '20:30',
+                'info': '⭐⭐⭐ 20:30 🇺🇸 美国非农就业数据 (本月首个周五)',
+                'importance': 3
+            })
+        
+        if events:
+            logger.info(f"生成财经日历提醒 {len(events)} 条")
+            return events
+        
+        # 如果是周末，返回休市提示
+        if today_weekday >= 5:
             return [{
                 'time': '全天',
-                'info': '📊 今日关注：主要货币汇率、贵金属价格、原油价格波动',
-                'importance': 2
+                'info': '📅 今日市场休市',
+                'importance': 1
             }]
-            
+        
+        # 默认返回一些通用提醒
+        return [{
+            'time': '全天',
+            'info': '📊 今日关注：主要货币汇率、贵金属价格、原油价格波动',
+            'importance': 2
+        }]
+        
     except Exception as e:
         logger.error(f"获取财经日历失败: {e}")
         return []
@@ -1222,13 +2479,10 @@ async def send_financial_calendar():
         
         message += "\n\n💡 <i>请关注重要数据发布时间</i>"
         
-        # 发送消息
-        await bot.send_message(
-            chat_id=CHAT_ID,
-            text=message,
-            parse_mode='HTML'
-        )
-        logger.info(f"财经日历发送成功: {current_date}")
+        # 发送到所有订阅的群组
+        chat_ids = subscription_registry.chats_for('calendar', datetime.now().hour)
+        sent_messages = await fanout_sender.send(chat_ids, message, parse_mode='HTML')
+        logger.info(f"财经日历发送成功: {current_date} ({len(sent_messages)}/{len(chat_ids)} 个群组)")
         
     except TelegramError as e:
         logger.error(f"发送财经日历失败: {e}")
@@ -1236,25 +2490,364 @@ async def send_financial_calendar():
         logger.error(f"生成财经日历时发生错误: {e}")
 
 
-async def ask_ai(question: str) -> str:
-    """使用Google Gemini回答问题"""
+class StreamingReply:
+    """把流式生成中的回答节流地编辑到占位消息上（每隔一段时间或新增一定字数编辑一次）"""
+
+    def __init__(self, message, prefix, interval, min_chars):
+        self.message = message
+        self.prefix = prefix
+        self.interval = interval
+        self.min_chars = min_chars
+        self._text = ""
+        self._shown = ""
+        self._last_edit = 0.0
+        self._task = None
+
+    def update(self, text):
+        """收到目前已生成的全文；同时只有一次编辑在进行"""
+        self._text = text
+        if self._task is not None:
+            return
+        if time.monotonic() - self._last_edit >= self.interval or len(text) - len(self._shown) >= self.min_chars:
+            self._task = asyncio.ensure_future(self._edit())
+
+    async def _edit(self):
+        text = self._text
+        try:
+            if text.strip() and text != self._shown:
+                await self.message.edit_text(f"{self.prefix}{text.rstrip()} ▌")
+                self._shown = text
+        except TelegramError as e:
+            logger.debug(f"编辑流式回答失败: {e}")
+        finally:
+            self._last_edit = time.monotonic()
+            self._task = None
+
+    async def finish(self, text):
+        """等待进行中的编辑完成后，用完整回答替换占位消息"""
+        if self._task is not None:
+            await self._task
+        await self.message.edit_text(f"{self.prefix}{text}")
+
+
+class AIQueueFull(Exception):
+    """AI请求排队过多"""
+
+
+def _is_rate_limited(error):
+    """Gemini返回429限流（ResourceExhausted）"""
+    return "429" in str(error) or type(error).__name__ in ('ResourceExhausted', 'TooManyRequests')
+
+
+class AIWorkerPool:
+    """Gemini调用专用工作池
+
+    使用独立的线程池，不占用 asyncio.to_thread 的默认线程池；同时进行的调用数有上限，
+    排队的提问按用户轮流执行（一个人连续提问不会挤占其他人），系统任务（财经简报）优先。
+    遇到429限流时按指数退避重试。
+    """
+
+    SYSTEM = 'system'  # 系统任务的用户标识
+
+    def __init__(self, workers, max_queue, max_per_user, retries, retry_delay):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='gemini')
+        self.running = 0
+        self._priority = deque()
+        self._queues = {}  # 用户 -> 排队中的请求
+        self._rotation = deque()  # 有请求排队的用户，按轮转顺序
+        self._ready = None
+        self._worker_tasks = []
+
+    def queued(self):
+        """排队中的请求数"""
+        return len(self._priority) + sum(len(queue) for queue in self._queues.values())
+
+    def _position(self, user):
+        """user新提交的请求在队列中的位置，0表示有空闲的工作者可以立即执行"""
+        queue = self._queues.get(user)
+        rounds = len(queue) + 1 if queue else 1
+        ahead = len(self._priority) + rounds - 1
+        before = True
+        for other in self._rotation:
+            if other == user:
+                before = False
+                continue
+            ahead += min(len(self._queues[other]), rounds if before else rounds - 1)
+        
+        idle = self.workers - self.running
+        if ahead < idle:
+            return 0
+        return ahead - idle + 1
+
+    def submit(self, user, func, *args, **kwargs):
+        """提交一次Gemini调用，返回 (future, 排队位置)；排队过多时抛出 AIQueueFull"""
+        if user != self.SYSTEM:
+            if self.queued() >= self.max_queue:
+                raise AIQueueFull("当前提问的人太多，请稍后再试")
+            if len(self._queues.get(user, ())) >= self.max_per_user:
+                raise AIQueueFull("你的上一个问题还在排队，请等回答后再问")
+        
+        self._start()
+        future = asyncio.get_running_loop().create_future()
+        job = (future, func, args, kwargs)
+        if user == self.SYSTEM:
+            position = 0
+            self._priority.append(job)
+        else:
+            position = self._position(user)
+            queue = self._queues.get(user)
+            if queue is None:
+                queue = self._queues[user] = deque()
+                self._rotation.append(user)
+            queue.append(job)
+        self._ready.release()
+        return future, position
+
+    async def run(self, user, func, *args, on_queued=None, **kwargs):
+        """提交并等待结果，需要排队时先调用 on_queued(位置)"""
+        future, position = self.submit(user, func, *args, **kwargs)
+        if position and on_queued is not None:
+            await on_queued(position)
+        return await future
+
+    def _start(self):
+        """首次提交时启动工作者"""
+        if self._worker_tasks:
+            return
+        self._ready = asyncio.Semaphore(0)
+        self._worker_tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    def _next_job(self):
+        """取下一个请求：系统任务优先，其余按用户轮转"""
+        if self._priority:
+            return self._priority.popleft()
+        user = self._rotation.popleft()
+        queue = self._queues[user]
+        job = queue.popleft()
+        if queue:
+            self._rotation.append(user)
+        else:
+            del self._queues[user]
+        return job
+
+    async def _worker(self):
+        """工作者：循环取请求并在专用线程池中执行"""
+        while True:
+            await self._ready.acquire()
+            future, func, args, kwargs = self._next_job()
+            if future.done():  # 提问者已经不再等待
+                continue
+            
+            self.running += 1
+            try:
+                result = await self._call(func, args, kwargs)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self.running -= 1
+
+    async def _call(self, func, args, kwargs):
+        """执行一次调用，遇到限流时指数退避重试"""
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries + 1):
+            try:
+                return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+            except Exception as e:
+                if attempt >= self.retries or not _is_rate_limited(e):
+                    raise
+                delay = self.retry_delay * 2 ** attempt + random.uniform(0, self.retry_delay)
+                logger.warning(f"Gemini限流，{delay:.1f}秒后重试 ({attempt + 1}/{self.retries}): {e}")
+                await asyncio.sleep(delay)
+
+    def close(self):
+        """停止工作者并关闭线程池"""
+        for task in self._worker_tasks:
+            task.cancel()
+        self._worker_tasks = []
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+ai_worker_pool = AIWorkerPool(AI_WORKERS, AI_QUEUE_LIMIT, AI_USER_QUEUE_LIMIT, AI_RETRY_ATTEMPTS, AI_RETRY_BASE_DELAY)
+
+
+# AI问答行情上下文 - 问题中提到的品种（别名不区分大小写）
+INSTRUMENT_ALIASES = {key: item['aliases'] for key, item in INSTRUMENTS.items()}
+
+def _build_alias_index(aliases):
+    """别名（小写） -> 品种列表"""
+    index = {}
+    for key, names in aliases.items():
+        for name in names:
+            index.setdefault(name.lower(), []).append(key)
+    return index
+
+
+instrument_alias_index = _build_alias_index(INSTRUMENT_ALIASES)
+instrument_alias_matcher = KeywordMatcher(instrument_alias_index)
+
+
+def _cached_quote_line(key):
+    """从行情缓存读取品种并格式化（不发起请求），缓存中没有时返回None"""
+    if key not in INSTRUMENT_SOURCES:
+        return None
+    quote = quote_cache.get(*INSTRUMENT_SOURCES[key])
+    return render_quote(key, quote) if quote else None
+
+
+def _market_context_header():
+    return f"【参考数据】当前时间 {datetime.now().strftime('%Y-%m-%d %H:%M')}"
+
+
+def select_market_context(question):
+    """根据问题中提到的品种和关键词，从行情缓存和快讯缓冲区挑出相关数据，返回各行
+
+    只读取内存中已有的数据，不额外请求；加上当前时间后总长度不超过 AI_CONTEXT_MAX_CHARS。
+    不含当前时间，可以和问题一起作为回答缓存的键。没有相关数据时返回空列表。
+    """
+    lowered = question.lower()
+    aliases = instrument_alias_matcher.find_all(lowered)
+    keys = dict.fromkeys(key for alias in aliases for key in instrument_alias_index[alias])
+    
+    quote_lines = [line for line in map(_cached_quote_line, keys) if line]
+    
+    news_lines = []
+    # 品种的所有别名都用来匹配快讯（问"btc"也能找到写"比特币"的快讯）
+    terms = [alias.lower() for key in keys for alias in INSTRUMENT_ALIASES[key]]
+    terms += [keyword.lower() for keyword in news_keyword_matcher.find_all(question)]
+    if terms and NEWS_INGEST_ENABLED:
+        for item in news_ingester.latest_distinct(NEWS_BUFFER_SIZE):
+            text = item['text']
+            if any(term in text.lower() for term in terms):
+                news_lines.append(f"- {text[:AI_CONTEXT_NEWS_CHARS]}")
+                if len(news_lines) >= AI_CONTEXT_NEWS_LIMIT:
+                    break
+    
+    lines = []
+    if quote_lines:
+        lines.append("最新行情：")
+        lines.extend(quote_lines)
+    if news_lines:
+        lines.append("相关快讯：")
+        lines.extend(news_lines)
+    
+    # 按顺序保留，直到用完字数预算（行情在前，优先保留）
+    context = []
+    used = len(_market_context_header()) + 1
+    for line in lines:
+        if used + len(line) > AI_CONTEXT_MAX_CHARS:
+            break
+        context.append(line)
+        used += len(line) + 1
+    return context
+
+
+def ground_question(question, context_lines):
+    """在问题前附上当前时间和相关的行情、快讯，没有相关数据时原样返回"""
+    if not context_lines:
+        return question
+    context = "\n".join([_market_context_header()] + context_lines)
+    return f"{context}\n\n请参考以上数据回答（数据不足时如实说明，不要编造数字）。问题：{question}"
+
+
+class AIResponseCache:
+    """AI回答缓存（LRU + 过期时间），相同问题同时只向Gemini发一次请求"""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (回答, 写入时间)
+        self._inflight = {}
+
+    @staticmethod
+    def make_key(question, model, max_tokens, temperature):
+        """问题规范化（忽略大小写、多余空白和结尾标点）后与生成参数一起作为缓存键"""
+        prompt = ' '.join(question.lower().split()).rstrip('？?！!。.~～ ')
+        return (prompt, model, max_tokens, temperature)
+
+    def get(self, key):
+        """读取未过期的回答，命中时移到最近使用的位置"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        answer, stored_at = entry
+        if time.time() - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return answer
+
+    def put(self, key, answer):
+        """写入回答，超出容量时淘汰最久未使用的"""
+        self._entries[key] = (answer, time.time())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    async def get_or_create(self, key, loader):
+        """命中缓存直接返回；否则加入进行中的同一请求，或调用loader发起新请求"""
+        answer = self.get(key)
+        if answer is not None:
+            self.hits += 1
+            logger.info(f"AI回答命中缓存 (命中 {self.hits} / 未命中 {self.misses})")
+            return answer
+        
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._load(key, loader))
+            self._inflight[key] = task
+        else:
+            self.hits += 1
+            logger.info(f"AI回答合并到进行中的相同请求 (命中 {self.hits} / 未命中 {self.misses})")
+        
+        # shield: 某个提问者的处理被取消时不影响其他等待同一回答的人
+        return await asyncio.shield(task)
+
+    async def _load(self, key, loader):
+        """调用loader获取回答并写入缓存"""
+        try:
+            answer = await loader()
+            self.put(key, answer)
+            return answer
+        finally:
+            self._inflight.pop(key, None)
+
+
+ai_response_cache = AIResponseCache(AI_CACHE_SIZE, AI_CACHE_TTL)
+
+
+async def ask_ai(question: str, user_id=None, on_queued=None, on_partial=None) -> str:
+    """使用Google Gemini回答问题
+
+    user_id 用于工作池的公平排队；需要排队时调用 on_queued(位置)；
+    传入 on_partial 时流式生成，每收到一段调用 on_partial(已生成的全文)。
+    """
     if not config.AI_ENABLED:
         return "AI功能未启用"
     
     try:
-        # 使用 Gemini 生成回答
-        response = await asyncio.to_thread(
-            gemini_model.generate_content,
-            question,
-            generation_config=genai.types.GenerationConfig(
-                max_output_tokens=config.AI_MAX_TOKENS,
-                temperature=config.AI_TEMPERATURE
-            )
+        # 附上缓存中的相关行情和快讯；缓存键由问题和引用的数据组成（不含当前时间），
+        # 数据不变时重复的问题直接命中缓存，行情或快讯变化后不会返回旧回答
+        context_lines = select_market_context(question) if AI_GROUNDING_ENABLED else []
+        prompt = ground_question(question, context_lines)
+        key = AIResponseCache.make_key(
+            "\n".join(context_lines + [question]), config.GEMINI_MODEL, config.AI_MAX_TOKENS, config.AI_TEMPERATURE
         )
+        return await ai_response_cache.get_or_create(key, lambda: _generate_answer(prompt, user_id, on_queued, on_partial))
         
-        answer = response.text.strip()
-        return answer
-        
+    except AIQueueFull as e:
+        return f"⏳ {e}"
     except Exception as e:
         logger.error(f"AI回答失败 (模型: {config.GEMINI_MODEL}): {e}")
         # 如果是模型不存在的错误，提供更友好的提示
@@ -1263,66 +2856,146 @@ async def ask_ai(question: str) -> str:
         return f"抱歉，AI回答时出现错误: {str(e)}"
 
 
-async def handle_message(update: Update, context):
-    """处理接收到的消息"""
-    logger.info(f"收到消息更新: {update}")
+def _answer_generation_config():
+    return genai.types.GenerationConfig(
+        max_output_tokens=config.AI_MAX_TOKENS,
+        temperature=config.AI_TEMPERATURE
+    )
+
+
+def _stream_generate_content(question, emit):
+    """在工作池线程中流式调用Gemini，每收到一段就把已生成的全文交给emit"""
+    response = gemini_model.generate_content(question, generation_config=_answer_generation_config(), stream=True)
+    text = ""
+    for chunk in response:
+        try:
+            text += chunk.text
+        except ValueError:  # 没有文本的分片（如只含安全评级）
+            continue
+        emit(text)
+    return text
+
+
+async def _generate_answer(question, user_id, on_queued, on_partial=None):
+    """通过AI工作池调用Gemini生成回答（失败时抛出异常，错误信息不会进入缓存）"""
+    if AI_STREAM_ENABLED and on_partial is not None:
+        loop = asyncio.get_running_loop()
+        answer = await ai_worker_pool.run(
+            user_id,
+            _stream_generate_content,
+            question,
+            lambda text: loop.call_soon_threadsafe(on_partial, text),
+            on_queued=on_queued
+        )
+        return answer.strip()
     
-    if not update.message or not update.message.text:
-        logger.info("消息无文本内容，跳过")
-        return
+    response = await ai_worker_pool.run(
+        user_id,
+        gemini_model.generate_content,
+        question,
+        on_queued=on_queued,
+        generation_config=_answer_generation_config()
+    )
     
-    message_text = update.message.text.strip()
-    chat_id = update.message.chat_id
+    answer = response.text.strip()
+    return answer
+
+
+class BotQuestionFilter(filters.MessageFilter):
+    """只放行配置群组或已订阅群组里@机器人或回复机器人的消息
+
+    机器人身份在启动时获取一次；判断只看消息实体和回复对象，不请求API，
+    也不写日志，群里的普通聊天在这里就被丢弃。
+    """
+
+    def __init__(self):
+        super().__init__(name='BotQuestionFilter')
+        self.bot_id = None
+        self.username = None
+        self.mention_re = None
+
+    def set_identity(self, bot_id, username):
+        """记录机器人的ID和用户名（启动时调用一次）"""
+        self.bot_id = bot_id
+        self.username = username.lower()
+        self.mention_re = re.compile(re.escape(f"@{username}"), re.IGNORECASE)
+
+    def filter(self, message):
+        if self.bot_id is None:
+            return False
+        chat_id = str(message.chat_id)
+        if chat_id != CHAT_ID and chat_id not in subscription_registry:
+            return False
+        
+        reply = message.reply_to_message
+        if reply is not None and reply.from_user is not None and reply.from_user.id == self.bot_id:
+            return True
+        
+        for entity in message.entities:
+            if entity.type == MessageEntity.MENTION:
+                # 实体偏移按UTF-16计算，交给parse_entity截取
+                if message.parse_entity(entity)[1:].lower() == self.username:
+                    return True
+            elif entity.type == MessageEntity.TEXT_MENTION:
+                if entity.user is not None and entity.user.id == self.bot_id:
+                    return True
+        return False
+
+    def strip_mention(self, text):
+        """去掉消息中@机器人的部分"""
+        return self.mention_re.sub("", text).strip()
+
+
+bot_question_filter = BotQuestionFilter()
+
+
+async def handle_message(update: Update, context):
+    """处理@机器人或回复机器人的消息（已由 bot_question_filter 过滤）"""
+    message = update.effective_message
+    if message is None or message.from_user is None or not message.text:
+        return
     
-    logger.info(f"消息文本: {message_text}, 群组ID: {chat_id}, 配置的群组ID: {CHAT_ID}")
+    chat_id = message.chat_id
+    question = bot_question_filter.strip_mention(message.text)
     
-    # 只处理群组消息
-    if str(chat_id) != CHAT_ID:
-        logger.info(f"群组ID不匹配，跳过。收到: {chat_id}, 期望: {CHAT_ID}")
+    if not question:
         return
     
-    # 检查是否@机器人或回复机器人的消息
-    bot_username = (await context.bot.get_me()).username
-    logger.info(f"机器人用户名: {bot_username}")
+    logger.info(f"收到问题: {question}")
     
-    is_mentioned = f"@{bot_username}" in message_text
-    is_reply_to_bot = (update.message.reply_to_message and 
-                       update.message.reply_to_message.from_user.id == context.bot.id)
-    
-    logger.info(f"是否@机器人: {is_mentioned}, 是否回复机器人: {is_reply_to_bot}")
+    # 发送"正在思考"的提示
+    thinking_msg = await context.bot.send_message(
+        chat_id=chat_id,
+        text="🤔 正在思考...",
+        reply_to_message_id=message.message_id
+    )
     
-    if is_mentioned or is_reply_to_bot:
-        # 移除@机器人的部分
-        question = message_text.replace(f"@{bot_username}", "").strip()
-        
-        if not question:
-            return
-        
-        logger.info(f"收到问题: {question}")
-        
-        # 发送"正在思考"的提示
-        thinking_msg = await context.bot.send_message(
-            chat_id=chat_id,
-            text="🤔 正在思考...",
-            reply_to_message_id=update.message.message_id
-        )
-        
-        # 获取AI回答
-        answer = await ask_ai(question)
-        
-        # 删除"正在思考"的消息
+    async def show_queue_position(position):
         try:
-            await thinking_msg.delete()
-        except:
+            await thinking_msg.edit_text(f"⏳ 排队中，第{position}位")
+        except TelegramError:
             pass
-        
-        # 发送AI回答
+    
+    # 获取AI回答（人多时在工作池中排队；流式生成时边生成边编辑占位消息）
+    streamer = StreamingReply(thinking_msg, "🤖 ", AI_STREAM_EDIT_INTERVAL, AI_STREAM_EDIT_CHARS)
+    answer = await ask_ai(
+        question,
+        message.from_user.id,
+        show_queue_position,
+        streamer.update if AI_STREAM_ENABLED else None
+    )
+    
+    # 直接把"正在思考"的消息编辑成回答，编辑失败时再单独发送
+    try:
+        await streamer.finish(answer)
+    except TelegramError as e:
+        logger.warning(f"编辑回答消息失败，改为发送新消息: {e}")
         await context.bot.send_message(
             chat_id=chat_id,
             text=f"🤖 {answer}",
-            reply_to_message_id=update.message.message_id
+            reply_to_message_id=message.message_id
         )
-        logger.info(f"已回复问题: {question[:50]}...")
+    logger.info(f"已回复问题: {question[:50]}...")
 
 
 async def start_command(update: Update, context):
@@ -1342,7 +3015,8 @@ async def help_command(update: Update, context):
     """处理/help命令"""
     trump_info = ""
     if config.TRUMP_TWITTER_ENABLED:
-        trump_info = f"\n\n🐦 <b>川普推特监控</b>\n每{config.TRUMP_CHECK_INTERVAL}分钟自动检查川普推特\n发现新推文将立即推送到群里"
+        accounts = "\n".join(f"@{account['username']}: 每{account['interval']}分钟检查" for account in TWITTER_ACCOUNTS)
+        trump_info = f"\n\n🐦 <b>推特监控</b>\n{accounts}\n发现新推文将立即推送到群里"
     
     await update.message.reply_text(
         "📖 <b>使用说明：</b>\n\n"
@@ -1352,6 +3026,14 @@ async def help_command(update: Update, context):
         "\n\n🤖 <b>AI问答功能</b>\n"
         "- 在群里@机器人 + 问题\n"
         "- 或者回复机器人的消息来提问\n\n"
+        "📈 <b>价格查询</b>\n"
+        "/price - 全部价格，/price btc - 单个品种\n"
+        "/btc /gold /wti /sse 等快捷命令\n"
+        "/alert btc > 70000 - 价格提醒，/alert btc 3% 15m - 波动提醒\n\n"
+        "📬 <b>订阅推送</b>（群管理员）\n"
+        "/subscribe - 订阅全部推送\n"
+        "/subscribe price 9 21 - 价格推送只收9点和21点（不带整点时恢复全部时段）\n"
+        "/unsubscribe tweets - 取消推特推送\n\n"
         "<b>示例：</b>\n"
         "@bot 比特币是什么？\n"
         "@bot 如何理财？",
@@ -1359,21 +3041,492 @@ async def help_command(update: Update, context):
     )
 
 
-async def main():
-    """主函数"""
-    logger.info("机器人启动中...")
+# 价格查询命令 - 每个群组的冷却时间记录: (群组ID, 查询内容) -> 上次回复时间
+price_command_last_reply = {}
+
+# 品种快捷命令，如 /btc、/gold
+PRICE_COMMAND_KEYS = list(INSTRUMENT_ALIASES)
+
+
+def _price_command_cooling(chat_id, query):
+    """同一群组短时间内重复查询同一内容时不再回复"""
+    now = time.monotonic()
+    key = (chat_id, query)
+    if now - price_command_last_reply.get(key, -PRICE_COMMAND_COOLDOWN) < PRICE_COMMAND_COOLDOWN:
+        return True
+    price_command_last_reply[key] = now
+    if len(price_command_last_reply) > 10000:
+        for old_key, replied_at in list(price_command_last_reply.items()):
+            if now - replied_at >= PRICE_COMMAND_COOLDOWN:
+                del price_command_last_reply[old_key]
+    return False
+
+
+def build_board_message():
+    """用行情缓存中已有的数据生成完整的价格消息（不发起请求）"""
+    source_quotes = {
+        source: {
+            symbol: quote
+            for symbol in symbols
+            for quote in [quote_cache.get(source, symbol)]
+            if quote is not None
+        }
+        for source, (symbols, _) in PRICE_SOURCES.items()
+    }
+    return build_price_message(source_quotes, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+
+async def price_command(update: Update, context):
+    """处理/price [品种] 及 /btc、/gold 等快捷命令，从行情看板直接回复"""
+    command = update.effective_message.text.split()[0][1:].split('@')[0].lower()
+    if command == 'price':
+        query = ' '.join(context.args).lower()
+        keys = instrument_alias_index.get(query, [query]) if query else []
+    else:
+        query = command
+        keys = [command]
     
-    # 加载已发送的推文ID
-    load_sent_tweets()
+    if _price_command_cooling(update.effective_chat.id, query):
+        return
     
-    # 创建Application实例（用于接收消息）
-    application = Application.builder().token(BOT_TOKEN).build()
+    if not keys:
+        await update.effective_message.reply_text(build_board_message(), parse_mode='HTML')
+        return
     
-    # 添加消息处理器
-    application.add_handler(CommandHandler("start", start_command))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    lines = [line for line in map(_cached_quote_line, keys) if line]
+    if not lines:
+        if not all(key in INSTRUMENT_ALIASES for key in keys):
+            await update.effective_message.reply_text("未知品种，可选: " + " ".join(PRICE_COMMAND_KEYS))
+        else:
+            await update.effective_message.reply_text("暂无行情数据，请稍后再试")
+        return
+    await update.effective_message.reply_text("\n".join(lines), parse_mode='HTML')
+
+
+# 价格提醒
+ALERTS_FILE = "alerts.json"
+ALERT_RULE_RE = re.compile(r'^(\S+?)\s*([<>])\s*([\d,]+(?:\.\d+)?)$')
+ALERT_MOVE_RE = re.compile(r'^(\S+)\s+[±+-]?(\d+(?:\.\d+)?)%(?:\s+(\d+)\s*(m|min|分钟|h|小时)?)?$')
+ALERT_MAX_WINDOW = 24 * 3600  # 波动提醒的最长窗口（秒）
+
+
+class RollingWindow:
+    """时间窗口内的最低价和最高价（单调队列，每个数据点均摊O(1)）"""
+
+    __slots__ = ('seconds', '_min', '_max')
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self._min = deque()  # 价格递增
+        self._max = deque()  # 价格递减
+
+    def push(self, ts, price):
+        while self._min and self._min[-1][1] >= price:
+            self._min.pop()
+        self._min.append((ts, price))
+        while self._max and self._max[-1][1] <= price:
+            self._max.pop()
+        self._max.append((ts, price))
+        
+        cutoff = ts - self.seconds
+        while self._min[0][0] < cutoff:
+            self._min.popleft()
+        while self._max[0][0] < cutoff:
+            self._max.popleft()
+
+    @property
+    def low(self):
+        return self._min[0][1]
+
+    @property
+    def high(self):
+        return self._max[0][1]
+
+
+class AlertEngine:
+    """价格提醒引擎
+
+    规则按品种建立索引，每条新行情只检查关心该品种的规则：
+    above/below 在价格穿过阈值时提醒；move 在价格相对窗口内最低/最高价变动超过百分比时提醒，
+    窗口最低/最高价由共享的 RollingWindow 增量维护。
+    多进程部署时规则以文件为准：修改前先同步文件，读取和检查前发现文件变化就重新加载，
+    worker进程收到的 /alert 也能被primary进程检查到。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.rules = {}
+        self.next_id = 1
+        self._by_key = {}  # 品种 -> [规则]
+        self._windows = {}  # (品种, 窗口秒数) -> RollingWindow
+        self._key_windows = {}  # 品种 -> [RollingWindow]
+        self._last_price = {}
+        self._cooldown_until = {}  # 规则ID -> 时间
+        self._symbol_keys = {}  # (数据源, 代码) -> 品种
+        self._signature = None
+        self._checked_at = 0
+
+    def load(self):
+        """加载已保存的提醒规则"""
+        self._symbol_keys = {source_symbol: key for key, source_symbol in INSTRUMENT_SOURCES.items()}
+        try:
+            if os.path.exists(self.path):
+                self._read()
+            logger.info(f"已加载 {len(self.rules)} 条价格提醒")
+        except Exception as e:
+            logger.error(f"加载价格提醒失败: {e}")
+
+    def _read(self):
+        signature = file_signature(self.path)
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.next_id = data.get('next_id', 1)
+        self.rules = {
+            rule['id']: rule for rule in data.get('rules', [])
+            if rule['key'] in INSTRUMENT_SOURCES and self._valid_window(rule['type'], rule.get('window'))
+        }
+        self._reindex()
+        self._signature = signature
+
+    def refresh(self, force=False):
+        """规则文件被其他进程修改过时重新加载；不带force时每秒最多检查一次"""
+        now = time.monotonic()
+        if not force and now - self._checked_at < SHARED_FILE_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        signature = file_signature(self.path)
+        if signature is None or signature == self._signature:
+            return
+        try:
+            self._read()
+            logger.info(f"价格提醒文件已更新，重新加载 {len(self.rules)} 条规则")
+        except Exception as e:
+            logger.error(f"重新加载价格提醒失败: {e}")
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'next_id': self.next_id, 'rules': list(self.rules.values())}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._signature = file_signature(self.path)
+        except Exception as e:
+            logger.error(f"保存价格提醒失败: {e}")
+
+    def _reindex(self):
+        """重建品种索引；新出现的窗口从现在开始积累数据，不再使用的窗口丢弃"""
+        self._by_key = {}
+        windows = {}
+        for rule in self.rules.values():
+            self._by_key.setdefault(rule['key'], []).append(rule)
+            if rule['type'] == 'move':
+                window_key = (rule['key'], rule['window'])
+                windows[window_key] = self._windows.get(window_key) or RollingWindow(rule['window'])
+        self._windows = windows
+        self._key_windows = {}
+        for (key, _), window in windows.items():
+            self._key_windows.setdefault(key, []).append(window)
+
+    @staticmethod
+    def _valid_window(rule_type, window):
+        """波动提醒必须有 1秒~ALERT_MAX_WINDOW 的窗口，阈值提醒不需要窗口"""
+        if rule_type != 'move':
+            return True
+        return isinstance(window, int) and 0 < window <= ALERT_MAX_WINDOW
+
+    def add(self, chat_id, key, rule_type, value, window=None):
+        """添加规则，返回规则；波动提醒的窗口无效时抛出ValueError"""
+        if not self._valid_window(rule_type, window):
+            raise ValueError(f"无效的提醒窗口: {window}")
+        self.refresh(force=True)
+        rule = {'id': self.next_id, 'chat_id': chat_id, 'key': key, 'type': rule_type, 'value': value}
+        if rule_type == 'move':
+            rule['window'] = window
+        self.next_id += 1
+        self.rules[rule['id']] = rule
+        self._reindex()
+        self.save()
+        return rule
+
+    def remove(self, chat_id, rule_id=None):
+        """删除群组的一条规则（不指定时删除全部），返回删除的条数"""
+        self.refresh(force=True)
+        targets = [
+            rule['id'] for rule in self.rules.values()
+            if rule['chat_id'] == chat_id and (rule_id is None or rule['id'] == rule_id)
+        ]
+        for target in targets:
+            del self.rules[target]
+            self._cooldown_until.pop(target, None)
+        if targets:
+            self._reindex()
+            self.save()
+        return len(targets)
+
+    def rules_for(self, chat_id):
+        self.refresh()
+        return [rule for rule in self.rules.values() if rule['chat_id'] == chat_id]
+
+    def on_quote(self, quote):
+        """行情缓存的监听函数：用新行情检查相关规则"""
+        self.refresh()
+        key = self._symbol_keys.get((quote.source, quote.symbol))
+        rules = self._by_key.get(key)
+        if not rules or quote.price <= 0:
+            return
+        
+        price = quote.price
+        now = quote.fetched_at
+        last_price = self._last_price.get(key)
+        self._last_price[key] = price
+        for window in self._key_windows.get(key, ()):
+            window.push(now, price)
+        
+        for rule in rules:
+            if self._cooldown_until.get(rule['id'], 0) > now:
+                continue
+            message = None
+            if rule['type'] == 'above':
+                if last_price is not None and last_price < rule['value'] <= price:
+                    message = f"涨破 {rule['value']:g}"
+            elif rule['type'] == 'below':
+                if last_price is not None and last_price > rule['value'] >= price:
+                    message = f"跌破 {rule['value']:g}"
+            else:
+                window = self._windows[(key, rule['window'])]
+                rise = (price - window.low) / window.low * 100
+                fall = (window.high - price) / window.high * 100
+                minutes = rule['window'] // 60
+                if rise >= rule['value']:
+                    message = f"{minutes}分钟内上涨 {rise:.2f}%"
+                elif fall >= rule['value']:
+                    message = f"{minutes}分钟内下跌 {fall:.2f}%"
+                if message:
+                    # 同一波行情在一个窗口内只提醒一次
+                    self._cooldown_until[rule['id']] = now + rule['window']
+            
+            if message:
+                create_background_task(self._notify(rule, message, quote))
+
+    async def _notify(self, rule, message, quote):
+        instrument = INSTRUMENTS[rule['key']]
+        price_text = instrument['format'].format(quote.price)
+        text = f"🔔 <b>价格提醒</b>\n{instrument['label']} {message}\n当前: {price_text}"
+        await fanout_sender.send([rule['chat_id']], text, parse_mode='HTML')
+        logger.info(f"价格提醒 #{rule['id']} 已发送到 {rule['chat_id']}: {instrument['name']} {message}")
+
+
+alert_engine = AlertEngine(ALERTS_FILE)
+
+
+def _describe_alert(rule):
+    name = INSTRUMENTS[rule['key']]['name']
+    if rule['type'] == 'above':
+        return f"#{rule['id']} {name} 涨破 {rule['value']:g}"
+    if rule['type'] == 'below':
+        return f"#{rule['id']} {name} 跌破 {rule['value']:g}"
+    return f"#{rule['id']} {name} {rule['window'] // 60}分钟内波动 ±{rule['value']:g}%"
+
+
+def parse_alert_rule(text):
+    """解析提醒规则，返回 (品种, 类型, 数值, 窗口秒数)，无法解析时返回None
+
+    示例: "btc > 70000"、"金价 < 2400"、"btc 3% 15m"、"原油 2% 1h"
+    """
+    text = text.strip()
+    match = ALERT_RULE_RE.match(text)
+    if match:
+        name, op, value = match.groups()
+        rule_type, window = ('above' if op == '>' else 'below'), None
+        value = float(value.replace(',', ''))
+    else:
+        match = ALERT_MOVE_RE.match(text)
+        if not match:
+            return None
+        name, value, amount, unit = match.groups()
+        rule_type, value = 'move', float(value)
+        window = int(amount or 15) * (3600 if unit in ('h', '小时') else 60)
+        if not 0 < window <= ALERT_MAX_WINDOW:
+            return None
+    
+    keys = instrument_alias_index.get(name.lower(), [name.lower()])
+    if keys[0] not in INSTRUMENT_SOURCES or value <= 0:
+        return None
+    return keys[0], rule_type, value, window
+
+
+async def alert_command(update: Update, context):
+    """处理/alert命令
+
+    /alert              查看本群的提醒
+    /alert btc > 70000  价格穿过阈值时提醒
+    /alert btc 3% 15m   15分钟内波动超过3%时提醒
+    /alert del 3        删除3号提醒（/alert del all 删除全部）
+    """
+    chat_id = str(update.effective_chat.id)
+    args = context.args
+    
+    if not args:
+        rules = alert_engine.rules_for(chat_id)
+        if not rules:
+            await update.effective_message.reply_text(
+                "本群还没有价格提醒\n\n示例：\n/alert btc > 70000\n/alert 金价 < 2400\n/alert btc 3% 15m"
+            )
+        else:
+            await update.effective_message.reply_text("🔔 本群的价格提醒：\n" + "\n".join(map(_describe_alert, rules)))
+        return
+    
+    if not await _can_manage_subscription(update, context):
+        await update.effective_message.reply_text("只有群管理员可以修改价格提醒")
+        return
+    
+    if args[0] in ('del', 'delete', '删除'):
+        target = args[1] if len(args) > 1 else ''
+        if target == 'all':
+            removed = alert_engine.remove(chat_id)
+        elif target.lstrip('#').isdigit():
+            removed = alert_engine.remove(chat_id, int(target.lstrip('#')))
+        else:
+            await update.effective_message.reply_text("用法: /alert del 编号 或 /alert del all")
+            return
+        await update.effective_message.reply_text(f"已删除 {removed} 条提醒")
+        return
+    
+    parsed = parse_alert_rule(' '.join(args))
+    if parsed is None:
+        await update.effective_message.reply_text(
+            "无法识别的提醒规则\n\n示例：\n/alert btc > 70000\n/alert 金价 < 2400\n/alert btc 3% 15m（窗口1分钟~24小时）\n\n"
+            "可选品种: " + " ".join(INSTRUMENT_ALIASES)
+        )
+        return
+    if len(alert_engine.rules_for(chat_id)) >= ALERT_MAX_PER_CHAT:
+        await update.effective_message.reply_text(f"每个群组最多设置 {ALERT_MAX_PER_CHAT} 条提醒")
+        return
+    
+    rule = alert_engine.add(chat_id, *parsed)
+    logger.info(f"群组 {chat_id} 添加价格提醒: {rule}")
+    await update.effective_message.reply_text("✅ 已添加提醒\n" + _describe_alert(rule))
+
+
+def _parse_subscription_args(args):
+    """解析命令参数：推送类型（英文或中文名）和整点，返回 (推送类型, 整点, 无法识别的参数)"""
+    names = {name: feed for feed, name in FEEDS.items()}
+    feeds, hours, unknown = [], [], []
+    for arg in args:
+        if arg in FEEDS:
+            feeds.append(arg)
+        elif arg in names:
+            feeds.append(names[arg])
+        elif arg.isdigit() and 0 <= int(arg) <= 23:
+            hours.append(int(arg))
+        else:
+            unknown.append(arg)
+    return feeds, hours, unknown
+
+
+def _describe_subscription(subscription):
+    if not subscription:
+        return "当前没有订阅任何推送"
+    parts = []
+    for feed, hours in subscription['feeds'].items():
+        if feed not in FEEDS:
+            continue
+        if hours:
+            parts.append(f"{FEEDS[feed]}（只接收 " + "、".join(f"{hour}点" for hour in hours) + "）")
+        else:
+            parts.append(FEEDS[feed])
+    return "当前订阅：" + "、".join(parts)
+
+
+async def _can_manage_subscription(update, context):
+    """私聊可以直接订阅，群组里只有管理员可以修改订阅"""
+    chat = update.effective_chat
+    if chat.type == 'private':
+        return True
+    member = await context.bot.get_chat_member(chat.id, update.effective_user.id)
+    return member.status in ('administrator', 'creator')
+
+
+async def subscribe_command(update: Update, context):
+    """处理/subscribe命令：/subscribe [推送类型...] [整点...]"""
+    if not await _can_manage_subscription(update, context):
+        await update.effective_message.reply_text("只有群管理员可以修改订阅")
+        return
+    
+    feeds, hours, unknown = _parse_subscription_args(context.args)
+    if unknown:
+        await update.effective_message.reply_text(
+            f"无法识别: {' '.join(unknown)}\n可选推送: " + "、".join(f"{feed}({name})" for feed, name in FEEDS.items())
+        )
+        return
+    
+    chat_id = str(update.effective_chat.id)
+    subscription = subscription_registry.subscribe(chat_id, feeds or list(FEEDS), hours)
+    logger.info(f"群组 {chat_id} 订阅: {subscription}")
+    await update.effective_message.reply_text("✅ 订阅成功\n" + _describe_subscription(subscription))
+
+
+async def unsubscribe_command(update: Update, context):
+    """处理/unsubscribe命令：/unsubscribe [推送类型...]，不带参数时取消全部"""
+    if not await _can_manage_subscription(update, context):
+        await update.effective_message.reply_text("只有群管理员可以修改订阅")
+        return
+    
+    feeds, _, unknown = _parse_subscription_args(context.args)
+    if unknown:
+        await update.effective_message.reply_text(f"无法识别: {' '.join(unknown)}")
+        return
+    
+    chat_id = str(update.effective_chat.id)
+    subscription = subscription_registry.unsubscribe(chat_id, feeds)
+    logger.info(f"群组 {chat_id} 取消订阅: {feeds or '全部'}")
+    await update.effective_message.reply_text("已取消订阅\n" + _describe_subscription(subscription))
+
+
+async def receive_webhook_update(request):
+    """接收Telegram推送的更新，校验密钥后放入Application的更新队列"""
+    application = request.app['application']
+    token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    # 按字节比较：compare_digest 遇到含非ASCII字符的字符串会抛出TypeError
+    if not hmac.compare_digest(token.encode('utf-8', 'surrogateescape'), WEBHOOK_SECRET_TOKEN.encode('utf-8')):
+        logger.warning(f"webhook密钥校验失败，来源: {request.remote}")
+        return web.Response(status=403)
+    
+    try:
+        data = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return web.Response(status=400)
+    if not isinstance(data, dict):
+        return web.Response(status=400)
+    
+    try:
+        update = Update.de_json(data, application.bot)
+    except Exception as e:  # 字段类型不对时可能抛出各种异常（如AttributeError）
+        logger.warning(f"webhook更新格式错误: {e}")
+        return web.Response(status=400)
+    if update is None:
+        return web.Response(status=400)
+    
+    # 入队后立即返回，处理在Application的更新循环中进行
+    await application.update_queue.put(update)
+    return web.Response()
+
+
+async def start_webhook_server(application):
+    """启动内置的webhook服务器，返回runner用于关闭"""
+    app = web.Application(client_max_size=WEBHOOK_MAX_BODY)
+    app['application'] = application
+    app.router.add_post(WEBHOOK_PATH, receive_webhook_update)
     
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_LISTEN, WEBHOOK_PORT).start()
+    logger.info(f"webhook服务器已启动: http://{WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    return runner
+
+
+def create_scheduler():
+    """创建调度器并添加所有定时任务"""
     # 创建调度器
     scheduler = AsyncIOScheduler()
     
@@ -1414,6 +3567,18 @@ async def main():
     #     replace_existing=True
     # )
     
+    # 添加金十快讯增量抓取任务
+    if NEWS_INGEST_ENABLED:
+        from apscheduler.triggers.interval import IntervalTrigger
+        scheduler.add_job(
+            poll_financial_news,
+            IntervalTrigger(seconds=NEWS_POLL_INTERVAL),
+            id='news_ingest',
+            name=f'每{NEWS_POLL_INTERVAL}秒拉取金十快讯',
+            replace_existing=True
+        )
+        logger.info(f"已添加金十快讯增量抓取任务，每{NEWS_POLL_INTERVAL}秒一次")
+    
     # 添加财经日历定时任务 - 从配置文件读取
     for hour in config.CALENDAR_HOURS:
         minute = config.CALENDAR_MINUTES.get(hour, 0)
@@ -1428,35 +3593,124 @@ async def main():
         )
         logger.info(f"已添加财经日历任务: {time_label}{time_str}")
     
-    # 添加川普推特监控定时任务
+    # 添加推特监控定时任务 - 所有账号共用一个轮询任务，按各账号间隔的最大公约数触发
     if config.TRUMP_TWITTER_ENABLED:
         from apscheduler.triggers.interval import IntervalTrigger
+        poll_minutes = reduce(math.gcd, (account['interval'] for account in TWITTER_ACCOUNTS))
         scheduler.add_job(
             check_and_send_trump_tweets,
-            IntervalTrigger(minutes=config.TRUMP_CHECK_INTERVAL),
+            IntervalTrigger(minutes=poll_minutes),
             id='trump_twitter_check',
-            name=f'每{config.TRUMP_CHECK_INTERVAL}分钟检查川普推特',
+            name=f'每{poll_minutes}分钟检查推特',
             replace_existing=True
         )
-        logger.info(f"川普推特监控已启用，每{config.TRUMP_CHECK_INTERVAL}分钟检查一次")
+        for account in TWITTER_ACCOUNTS:
+            logger.info(f"推特监控已启用: @{account['username']}，每{account['interval']}分钟检查一次")
+    
+    return scheduler
+
+
+async def main():
+    """主函数"""
+    logger.info("机器人启动中...")
     
-    # 启动调度器
-    scheduler.start()
-    logger.info("调度器已启动")
+    use_webhook = TELEGRAM_MODE == 'webhook'
+    is_worker = use_webhook and WEBHOOK_ROLE == 'worker'
+    if use_webhook and not WEBHOOK_SECRET_TOKEN:
+        logger.error("webhook模式需要在config.py中设置WEBHOOK_SECRET_TOKEN")
+        return
+    if use_webhook and not WEBHOOK_SECRET_TOKEN_RE.fullmatch(WEBHOOK_SECRET_TOKEN):
+        logger.error("WEBHOOK_SECRET_TOKEN只能包含 A-Z a-z 0-9 _ -，长度1~256")
+        return
     
-    # 立即发送一次测试消息
-    await send_price_update()
+    # 加载已发送的推文ID和Twitter缓存（推特检查只在primary进程运行；
+    # 加载时会压缩并替换日志文件，worker进程不能碰，否则可能丢掉primary刚追加的记录）
+    if not is_worker:
+        sent_tweet_store.load(LEGACY_SENT_TWEETS_FILE, config.TRUMP_TWITTER_USERNAME)
+        load_twitter_state()
     
-    # 立即检查一次川普推特（如果启用）
-    if config.TRUMP_TWITTER_ENABLED:
-        logger.info("立即检查川普推特...")
-        await check_and_send_trump_tweets()
+    # 加载各群组的订阅
+    subscription_registry.load(CHAT_ID)
+    
+    # 创建共享HTTP连接池
+    get_http_session()
+    
+    # 行情历史由primary进程写入
+    if QUOTE_HISTORY_ENABLED and not is_worker:
+        quote_history.start()
+        quote_cache.listeners.append(quote_history.record)
+    
+    # 价格提醒规则所有进程都加载（用于 /alert 查看和修改），只由primary进程检查
+    alert_engine.load()
+    if not is_worker:
+        quote_cache.listeners.append(alert_engine.on_quote)
+    
+    # 启动行情看板：只由primary进程请求数据源，webhook模式下写入快照；
+    # worker进程读取快照回复/price命令，进程再多也不会增加对数据源的请求
+    if QUOTE_BOARD_ENABLED:
+        if is_worker:
+            quote_cache.follow_snapshot(QUOTE_SNAPSHOT_FILE)
+        else:
+            start_quote_board(QUOTE_SNAPSHOT_FILE if use_webhook else None)
+    
+    # 创建Application实例（用于接收消息）
+    application = Application.builder().token(BOT_TOKEN).build()
+    
+    # 添加消息处理器
+    application.add_handler(CommandHandler("start", start_command))
+    application.add_handler(CommandHandler("help", help_command))
+    # 只处理新消息：编辑过的消息和频道消息不重复回复
+    application.add_handler(CommandHandler("subscribe", subscribe_command, filters=filters.UpdateType.MESSAGE))
+    application.add_handler(CommandHandler(["price"] + PRICE_COMMAND_KEYS, price_command, filters=filters.UpdateType.MESSAGE))
+    application.add_handler(CommandHandler("alert", alert_command, filters=filters.UpdateType.MESSAGE))
+    application.add_handler(CommandHandler("unsubscribe", unsubscribe_command, filters=filters.UpdateType.MESSAGE))
+    application.add_handler(MessageHandler(
+        filters.UpdateType.MESSAGE & filters.TEXT & ~filters.COMMAND & bot_question_filter, handle_message
+    ))
+    
+    # worker进程只处理消息，定时任务由primary进程负责
+    scheduler = None
+    if not is_worker:
+        scheduler = create_scheduler()
+        
+        # 启动调度器
+        scheduler.start()
+        logger.info("调度器已启动")
+        
+        # 立即发送一次测试消息
+        await send_price_update()
+        
+        # 立即拉取一次金十快讯，填充缓冲区
+        if NEWS_INGEST_ENABLED:
+            await poll_financial_news()
+        
+        # 立即检查一次川普推特（如果启用）
+        if config.TRUMP_TWITTER_ENABLED:
+            logger.info("立即检查推特...")
+            await check_and_send_trump_tweets()
     
     # 启动bot接收消息
     logger.info("启动消息接收...")
     await application.initialize()
+    
+    # 机器人身份只获取一次（initialize时已调用get_me），之后过滤消息不再请求API
+    bot_question_filter.set_identity(application.bot.id, application.bot.username)
+    logger.info(f"机器人用户名: @{application.bot.username}")
     await application.start()
-    await application.updater.start_polling(drop_pending_updates=True)
+    
+    webhook_runner = None
+    if use_webhook:
+        webhook_runner = await start_webhook_server(application)
+        if not is_worker:
+            await application.bot.set_webhook(
+                url=WEBHOOK_URL,
+                secret_token=WEBHOOK_SECRET_TOKEN,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                drop_pending_updates=True
+            )
+            logger.info(f"已注册webhook: {WEBHOOK_URL}")
+    else:
+        await application.updater.start_polling(drop_pending_updates=True)
     
     logger.info("机器人已启动，AI功能已" + ("启用" if config.AI_ENABLED else "禁用"))
     
@@ -1464,12 +3718,19 @@ async def main():
     try:
         while True:
             await asyncio.sleep(1)
-    except (KeyboardInterrupt, SystemExit):
+    except (KeyboardInterrupt, SystemExit, asyncio.CancelledError):
         logger.info("正在关闭...")
-        await application.updater.stop()
+        if webhook_runner is not None:
+            await webhook_runner.cleanup()
+        if application.updater.running:
+            await application.updater.stop()
         await application.stop()
         await application.shutdown()
-        scheduler.shutdown()
+        if scheduler is not None:
+            scheduler.shutdown()
+        ai_worker_pool.close()
+        quote_history.close()
+        await close_http_session()
 
 
 if __name__ == '__main__':
@@ -32,3 +32,114 @@ GEMINI_MODEL = "gemini-2.5-flash"  # 使用的AI模型 (推荐: gemini-2.5-flash
 AI_MAX_TOKENS = 500  # AI回复的最大token数
 AI_TEMPERATURE = 0.7  # 回复的创造性程度（0-1）
 AI_ENABLED = True  # 是否启用AI功能
+
+# HTTP连接池配置（所有行情/新闻/推文请求共享）
+HTTP_POOL_LIMIT = 50  # 连接池总连接数上限
+HTTP_LIMIT_PER_HOST = 6  # 每个主机的最大并发连接数
+HTTP_DNS_CACHE_TTL = 300  # DNS缓存时间（秒）
+HTTP_KEEPALIVE_TIMEOUT = 60  # 空闲连接保持时间（秒）
+
+# 行情缓存配置
+QUOTE_CACHE_TTL = {'yahoo': 60, 'eastmoney': 30, 'fx168': 60}  # 各数据源的缓存有效期（秒）
+QUOTE_CACHE_MAX_STALE = 6 * 3600  # 数据源故障时，旧数据最多继续使用多久（秒）
+
+# 价格推送的品种（按列表顺序显示，不配置时使用内置的12个品种）
+# source: 数据源（yahoo / eastmoney / fx168）; symbol: 数据源中的代码（东方财富为secid，如 "1.000300"）
+# format: 价格格式，也可以只写 decimals（小数位）及可选的 prefix/suffix
+# calendar: 24h=不标注, spot=只标注周末, index=周末及收盘, sge=上金所闭市, a_share=A股交易时段
+# aliases: /price 查询及AI问答识别品种用的别名; key 同时是快捷命令名（如 /csi300）
+# 同一数据源的品种自动合并为一次批量请求，新增品种只需加一行
+# INSTRUMENTS = [
+#     {'key': 'btc', 'source': 'yahoo', 'symbol': 'BTC-USD', 'name': 'BTC', 'label': '🪙 BTC',
+#      'format': '${:,.2f}', 'calendar': '24h', 'aliases': ['BTC', '比特币']},
+#     {'key': 'csi300', 'source': 'eastmoney', 'symbol': '1.000300', 'name': '沪深300', 'label': '📊 沪深300',
+#      'decimals': 2, 'calendar': 'a_share', 'aliases': ['沪深300']},
+#     {'key': 'au9999', 'source': 'eastmoney', 'symbol': '118.AU9999', 'name': 'Au99.99', 'label': '🏆 Au99.99',
+#      'decimals': 2, 'prefix': '¥', 'suffix': '/克', 'calendar': 'sge'},
+# ]
+
+# 价格推送截止时间
+PRICE_PUSH_DEADLINE = 3  # 最多等待数据源的时间（秒），超时的先用缓存或"--"占位
+PRICE_PUSH_EDIT_LATE = True  # 迟到的数据返回后是否编辑已发送的消息补上
+PRICE_PUSH_LATE_WINDOW = 30  # 最多等待迟到数据的时间（秒）
+
+# 推文镜像竞速（Nitter / RSS Bridge / Syndication API）
+TWITTER_RSS_BRIDGE_INSTANCES = [
+    "https://rss-bridge.org/bridge01/",
+    "https://wtf.roflcopter.fr/rss-bridge/",
+]
+TWEET_RACE_ENABLED = True  # 同时请求多个镜像，取最先返回的有效结果
+TWEET_RACE_FANOUT = 3  # 同时请求的镜像数量
+TWEET_HEDGE_DELAY = 0.5  # 追加下一个镜像前的等待时间（秒），0表示同时发出
+
+# 已发送推文记录
+SENT_TWEETS_KEEP = 500  # 每个账号保留的已发送推文ID数量
+
+# 多账号推特监控（可选，未配置时只监控 TRUMP_TWITTER_USERNAME）
+# TWITTER_ACCOUNTS = [
+#     {'username': 'elonmusk', 'interval': 3, 'chat_id': CHAT_ID},
+#     {'username': 'realDonaldTrump', 'interval': 5},  # 不填chat_id时推送到CHAT_ID
+# ]
+TWEET_MIRROR_CONCURRENCY = 2  # 每个镜像同时进行的请求数上限，避免被限流
+
+# 财经新闻过滤关键词（可选，不填则使用bot.py中的默认列表；关键词数量不影响过滤速度）
+# NEWS_KEYWORDS = ['金价', '黄金', '美元', '原油', '美联储', '鲍威尔', 'NVDA', '英伟达']
+
+# 金十快讯增量抓取（财经简报和AI问答从内存缓冲区读取，不在发送时临时抓取）
+NEWS_INGEST_ENABLED = True
+NEWS_POLL_INTERVAL = 120  # 拉取间隔（秒）
+NEWS_BUFFER_SIZE = 200  # 内存中保留的快讯数量
+NEWS_DEDUP_THRESHOLD = 0.7  # 近似重复判定的相似度阈值（0~1），措辞略有不同的同一条新闻只保留一条（关键词或数字不同的不算重复）
+
+# AI问答缓存（相同问题在有效期内直接返回上次的回答，不重复调用Gemini）
+AI_CACHE_SIZE = 256  # 最多缓存的回答数量
+AI_CACHE_TTL = 600  # 回答缓存有效期（秒）
+
+# AI工作池（Gemini调用使用独立线程池，排队的提问按用户轮流处理）
+AI_WORKERS = 2  # 同时进行的Gemini调用数
+AI_QUEUE_LIMIT = 20  # 排队的提问总数上限，超出时提示稍后再试
+AI_USER_QUEUE_LIMIT = 1  # 每个用户同时排队的提问数上限
+AI_RETRY_ATTEMPTS = 3  # 遇到429限流时的重试次数
+AI_RETRY_BASE_DELAY = 2  # 首次重试等待时间（秒），之后每次翻倍
+
+# AI流式回答（边生成边编辑"正在思考"消息，不用等全部生成完）
+AI_STREAM_ENABLED = True
+AI_STREAM_EDIT_INTERVAL = 1.0  # 两次编辑的最短间隔（秒），避免触发Telegram限流
+AI_STREAM_EDIT_CHARS = 150  # 新增字数达到该值时提前编辑
+
+# AI问答行情上下文（问题提到BTC、金价等品种时，附上缓存中的最新行情和相关快讯，不额外请求）
+AI_GROUNDING_ENABLED = True
+AI_CONTEXT_MAX_CHARS = 600  # 附加上下文的字数上限
+AI_CONTEXT_NEWS_LIMIT = 3  # 最多附加的快讯条数
+AI_CONTEXT_NEWS_CHARS = 120  # 每条快讯最多保留的字数
+
+# 接收消息方式: polling=长轮询（默认）, webhook=内置服务器接收Telegram推送（需要公网HTTPS地址）
+TELEGRAM_MODE = "polling"
+# WEBHOOK_URL = "https://bot.example.com/telegram"  # Telegram推送的公网地址
+# WEBHOOK_SECRET_TOKEN = "replace_with_random_token"  # 校验请求来源，只允许 A-Z a-z 0-9 _ -
+# WEBHOOK_LISTEN = "127.0.0.1"  # 内置服务器监听地址
+# WEBHOOK_PORT = 8443  # 监听端口（可用环境变量 WEBHOOK_PORT 覆盖）
+# WEBHOOK_PATH = "/telegram"
+# WEBHOOK_ROLE = "primary"  # primary=负责定时任务和注册webhook, worker=只处理消息（可用环境变量 WEBHOOK_ROLE 覆盖）
+#                          # 行情看板只由primary请求数据源并写入 quote_snapshot.json，worker读取快照回复/price
+
+# 多群组推送限速（订阅用 /subscribe 命令管理，保存在 subscriptions.json）
+FANOUT_GLOBAL_RATE = 25  # 每秒最多发送的消息数（Telegram整体限制约30条/秒）
+FANOUT_CHAT_RATE = 1 / 3  # 每个群组每秒最多发送的消息数（Telegram限制同一群组约20条/分钟）
+FANOUT_CHAT_BURST = 3  # 每个群组允许的突发条数
+FANOUT_CONCURRENCY = 20  # 同时进行的发送请求数
+FANOUT_RETRIES = 3  # 触发限流后的重试次数
+
+# 行情看板（后台定时刷新，/price、/btc 等命令直接读取，不临时请求数据源）
+QUOTE_BOARD_ENABLED = True
+QUOTE_BOARD_INTERVALS = {'yahoo': 45, 'eastmoney': 20, 'fx168': 45}  # 各数据源刷新间隔（秒）
+PRICE_COMMAND_COOLDOWN = 10  # 同一群组重复查询的冷却时间（秒）
+
+# 行情历史（写入本地SQLite数据库，后台批量写入，不影响推送速度）
+QUOTE_HISTORY_ENABLED = True
+QUOTE_HISTORY_FILE = 'quotes.db'
+QUOTE_HISTORY_RAW_DAYS = 7  # 原始数据保留天数，更早的合并为小时K线
+QUOTE_HISTORY_KEEP_DAYS = 365  # 小时K线保留天数
+
+# 价格提醒（用 /alert 命令设置，保存在 alerts.json）
+ALERT_MAX_PER_CHAT = 20  # 每个群组最多设置的提醒数
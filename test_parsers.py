@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""页面解析测试 - 用 fixtures/ 中保存的Nitter时间线和金十快讯页面检查解析结果，并测量耗时
+
+当前页面结构检查推文ID、时间和内容属于同一条推文，转发和回复被跳过；
+*_legacy.html 是旧写法（三次全文扫描后按位置配对）也能正确解析的页面，用来公平对比耗时。
+
+用法: python test_parsers.py
+"""
+
+import os
+import re
+import timeit
+from html import unescape
+
+import bot
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+EXPECTED_TWEETS = [
+    ('1800000000000000105', 'Jun 10, 2024 · 3:04 PM UTC', 'Starship flight 4 is go for launch & landing attempt #SpaceX'),
+    ('1800000000000000101', 'Jun 9, 2024 · 9:41 PM UTC', 'Tesla AI training compute > 85k H100 equivalents'),
+]
+
+# 快讯保留HTML实体（消息按HTML格式发送）；VIP快讯没有正文，不会被解析出来
+EXPECTED_FLASHES = [
+    ('20240610150405101800', '美联储宣布维持利率不变，符合市场预期'),
+    ('20240610150212100900', '现货黄金日内上涨2.00%，现报2330.50美元/盎司'),
+    ('20240610145801100200', '标普500指数&amp;纳斯达克指数 双双高开'),
+]
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def legacy_parse_nitter(html):
+    """旧写法：内容、ID、时间各扫描一次全文，再按位置配对"""
+    contents = re.findall(r'<div class="tweet-content[^"]*"[^>]*>(.*?)</div>', html, re.DOTALL)
+    tweet_ids = re.findall(r'href="/[^/]+/status/(\d+)"', html)
+    times = re.findall(r'<span class="tweet-date"[^>]*title="([^"]+)"', html)
+    items = []
+    for i, (content, tweet_id) in enumerate(zip(contents[:5], tweet_ids[:5])):
+        content = unescape(re.sub(r'<[^>]+>', '', content)).strip()
+        if content.startswith('RT @') or content.startswith('@'):
+            continue
+        items.append((tweet_id, times[i] if i < len(times) else "未知时间", content))
+    return items
+
+
+def legacy_parse_jin10(html):
+    """旧写法：只取快讯文本，没有快讯ID"""
+    pattern = r'class="flash-text">([^<]+(?:<[^>]+>[^<]+)*)</div>'
+    return [' '.join(re.sub(r'<[^>]+>', '', match).split()) for match in re.findall(pattern, html)]
+
+
+def per_call_us(func, html, number=2000):
+    """单次调用的平均耗时（微秒）"""
+    return timeit.timeit(lambda: func(html), number=number) / number * 1e6
+
+
+def repeat_items(html, first_item, end_marker, times):
+    """把页面中的条目重复若干遍，模拟一整页的规模"""
+    start = html.index(first_item)
+    end = html.rindex(end_marker)
+    return html[:end] + html[start:end] * (times - 1) + html[end:]
+
+
+def check_nitter():
+    html = load_fixture('nitter_timeline.html')
+    tweets = bot.parse_nitter_timeline(html)
+    assert tweets == EXPECTED_TWEETS, f"Nitter解析结果不符:\n{tweets}"
+    print(f"✅ Nitter: 解析出 {len(tweets)} 条推文，跳过转发1条、回复2条，ID/时间/内容一一对应")
+    legacy = legacy_parse_nitter(html)
+    print(f"   旧写法在当前页面结构上解析出 {len(legacy)} 条（链接带#m，ID匹配不到）")
+
+    # 耗时对比使用旧写法也能正确解析的页面结构（每条推文只有一个状态链接），两者结果必须一致
+    html = load_fixture('nitter_timeline_legacy.html')
+    assert bot.parse_nitter_timeline(html) == legacy_parse_nitter(html), "新旧写法在旧页面结构上结果不一致"
+    page = repeat_items(html, '<div class="timeline-item', '</div>\n</body>', 4)
+    new_us = per_call_us(bot.parse_nitter_timeline, page)
+    old_us = per_call_us(legacy_parse_nitter, page)
+    print(f"✅ Nitter旧页面结构: 新旧写法结果一致；耗时（20条/页，取前5条）: 新 {new_us:.1f} us, 旧 {old_us:.1f} us")
+
+
+def check_jin10():
+    html = load_fixture('jin10_flash.html')
+    flashes = bot.parse_jin10_items(html)
+    assert flashes == EXPECTED_FLASHES, f"金十解析结果不符:\n{flashes}"
+    print(f"✅ 金十: 解析出 {len(flashes)} 条快讯（含以<b>开头的重要快讯），跳过VIP快讯1条")
+    legacy = legacy_parse_jin10(html)
+    print(f"   旧写法解析出 {len(legacy)} 条（漏掉以<b>开头的重要快讯，且没有快讯ID）")
+
+    # 耗时对比使用旧写法也能正确解析的快讯（不以标签开头），两者文本必须一致
+    html = load_fixture('jin10_flash_legacy.html')
+    assert [text for _, text in bot.parse_jin10_items(html)] == legacy_parse_jin10(html), "新旧写法在旧页面上结果不一致"
+    page = repeat_items(html, '<div id="flash', '</div>\n</body>', 10)
+    new_us = per_call_us(bot.parse_jin10_items, page)
+    old_us = per_call_us(legacy_parse_jin10, page)
+    print(f"✅ 金十旧页面: 新旧写法文本一致；耗时（40条/页）: 新 {new_us:.1f} us（含快讯ID）, 旧 {old_us:.1f} us")
+
+
+if __name__ == '__main__':
+    check_nitter()
+    check_jin10()
+    print("全部通过")
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""群消息过滤测试 - 检查哪些消息会交给AI问答处理，并测量被忽略的消息每条的开销
+
+机器人身份只在启动时获取一次，过滤只看消息实体和回复对象，不请求API、不写日志。
+这里用固定的机器人身份构造消息，不需要网络。
+
+用法: python test_question_filter.py
+"""
+
+import timeit
+
+from telegram import Bot, Update, User
+from telegram.ext import MessageHandler, filters
+
+import bot
+
+BOT_ID = 123456
+BOT_USERNAME = 'price_helper_bot'
+GROUP = {'id': int(bot.CHAT_ID), 'type': 'supergroup', 'title': '测试群'}
+OTHER_GROUP = {'id': -1009999999999, 'type': 'supergroup', 'title': '其他群'}
+SENDER = {'id': 42, 'is_bot': False, 'first_name': '张三'}
+
+
+def make_message(text, chat=GROUP, entities=(), reply_to=None):
+    message = {
+        'message_id': 1,
+        'date': 1718000000,
+        'chat': chat,
+        'from': SENDER,
+        'text': text,
+        'entities': list(entities),
+    }
+    if reply_to is not None:
+        message['reply_to_message'] = reply_to
+    return message
+
+
+def mention(username):
+    """@用户名 位于消息开头的mention实体（偏移按UTF-16计算）"""
+    return {'type': 'mention', 'offset': 0, 'length': len(username) + 1}
+
+
+CASES = [
+    # (说明, 消息, 是否交给AI处理)
+    ('普通群聊', make_message('今天金价涨了不少'), False),
+    ('@其他人', make_message('@someone_else 金价多少', entities=[mention('someone_else')]), False),
+    ('未订阅群组@机器人',
+     make_message(f'@{BOT_USERNAME} 金价多少', chat=OTHER_GROUP, entities=[mention(BOT_USERNAME)]), False),
+    ('@机器人', make_message(f'@{BOT_USERNAME} 金价多少', entities=[mention(BOT_USERNAME)]), True),
+    ('@机器人（大小写不同）',
+     make_message(f'@{BOT_USERNAME.upper()} 金价多少', entities=[mention(BOT_USERNAME)]), True),
+    ('回复机器人', make_message('那原油呢', reply_to={
+        'message_id': 0, 'date': 1718000000, 'chat': GROUP, 'text': '🤖 ...',
+        'from': {'id': BOT_ID, 'is_bot': True, 'first_name': 'bot', 'username': BOT_USERNAME},
+    }), True),
+]
+
+
+def per_call_us(func, number=20000):
+    """单次调用的平均耗时（微秒）"""
+    return timeit.timeit(func, number=number) / number * 1e6
+
+
+def main():
+    telegram_bot = Bot(bot.BOT_TOKEN)
+    telegram_bot._bot_user = User(BOT_ID, 'bot', True, username=BOT_USERNAME)
+    bot.bot_question_filter.set_identity(BOT_ID, BOT_USERNAME)
+    # 与 main() 中注册的处理器使用同样的过滤条件
+    handler = MessageHandler(
+        filters.UpdateType.MESSAGE & filters.TEXT & ~filters.COMMAND & bot.bot_question_filter, bot.handle_message
+    )
+
+    for description, message, expected in CASES:
+        update = Update.de_json({'update_id': 1, 'message': message}, telegram_bot)
+        accepted = bool(handler.check_update(update))
+        assert accepted == expected, f"{description}: 期望 {expected}，实际 {accepted}"
+        print(f"✅ {description}: {'处理' if accepted else '忽略'}")
+
+    print("每条消息的过滤耗时:")
+    for description, message, expected in CASES[:3]:
+        update = Update.de_json({'update_id': 1, 'message': message}, telegram_bot)
+        print(f"   {description}: {per_call_us(lambda: handler.check_update(update)):.2f} us")
+    print("全部通过")
+
+
+if __name__ == '__main__':
+    main()